@@ -0,0 +1,88 @@
+"""Compares the OrderedDict LRUCache against the previous linked-list implementation
+
+Run from the repository root with ``python -m benchmarks.cache_benchmark``.
+Both caches are sized like BotCache (2048 entries) and keyed by guild/user ID strings.
+The linked-list cache is the original class, copied unchanged into
+benchmarks/legacy_cache.py.
+"""
+import random
+import timeit
+import tracemalloc
+
+from benchmarks.legacy_cache import LRUCache as LegacyLRUCache
+from bot_helpers.cache import LRUCache
+
+CAPACITY = 2048
+OPS = 200_000
+# The legacy get() only returns its fallback for a missing key when it is not None
+MISSING = object()
+
+
+def snowflakes(count, seed):
+    rng = random.Random(seed)
+    return [str(rng.randrange(10**17, 10**18)) for _ in range(count)]
+
+
+def filled(cache_cls, keys):
+    cache = cache_cls(CAPACITY, None)
+    for key in keys:
+        cache.put(key, ";")
+    return cache
+
+
+def per_op_ns(func, ops):
+    return min(timeit.repeat(func, number=1, repeat=5)) / ops * 1e9
+
+
+def bench(cache_cls):
+    resident = snowflakes(CAPACITY, seed=1)
+    churn = snowflakes(OPS, seed=2)
+    rng = random.Random(3)
+    hot = [rng.choice(resident) for _ in range(OPS)]
+    mixed = [rng.choice(resident) if rng.random() < 0.9 else key for key in churn]
+
+    def hits():
+        cache = filled(cache_cls, resident)
+        for key in hot:
+            cache.get(key, MISSING)
+
+    def inserts():
+        cache = filled(cache_cls, resident)
+        for key in churn:
+            cache.put(key, ";")
+
+    def mixed_ops():
+        cache = filled(cache_cls, resident)
+        for key in mixed:
+            if cache.get(key, MISSING) is MISSING:
+                cache.put(key, ";")
+
+    fill_ns = per_op_ns(lambda: filled(cache_cls, resident), CAPACITY)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = filled(cache_cls, resident)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del cache
+
+    return {
+        "get hit (ns/op)": per_op_ns(hits, OPS) - fill_ns * CAPACITY / OPS,
+        "put + evict (ns/op)": per_op_ns(inserts, OPS) - fill_ns * CAPACITY / OPS,
+        "90% hit mix (ns/op)": per_op_ns(mixed_ops, OPS) - fill_ns * CAPACITY / OPS,
+        "memory at capacity (KiB)": memory / 1024,
+    }
+
+
+def main():
+    legacy = bench(LegacyLRUCache)
+    current = bench(LRUCache)
+
+    print(f"{'':28}{'linked list':>14}{'OrderedDict':>14}{'change':>10}")
+    for metric in legacy:
+        change = (current[metric] - legacy[metric]) / legacy[metric] * 100
+        print(f"{metric:28}{legacy[metric]:>14.1f}{current[metric]:>14.1f}{change:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compares a fresh aiohttp session per Last.fm request against the shared bot session
+
+Run from the repository root with ``python -m benchmarks.http_benchmark``.
+A local stub server stands in for ws.audioscrobbler.com and answers with a
+track.getInfo-shaped payload, so the numbers only measure client-side overhead.
+"""
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+from bot_helpers.utils import create_session
+
+REQUESTS = 500
+FAN_OUT = 20
+PAYLOAD = {"track": {"name": "Track", "playcount": "1024", "userplaycount": "3"}}
+
+
+async def handle(request):
+    return web.json_response(PAYLOAD)
+
+
+async def start_stub():
+    app = web.Application()
+    app.router.add_get("/2.0/", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/2.0/"
+
+
+async def fresh_session_request(url, params):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, params=params) as resp:
+            return await resp.json()
+
+
+async def shared_session_request(session, url, params):
+    async with session.get(url, params=params) as resp:
+        return await resp.json()
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+async def sequential(request):
+    return [await timed(request()) for _ in range(REQUESTS)]
+
+
+async def fan_out(request):
+    rounds = REQUESTS // FAN_OUT
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(request() for _ in range(FAN_OUT)))
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+async def main():
+    runner, url = await start_stub()
+    params = {"method": "track.getInfo", "artist": "Artist", "track": "Track"}
+    session = create_session()
+
+    try:
+        results = {}
+        for name, request in (
+            ("fresh session", lambda: fresh_session_request(url, params)),
+            ("shared session", lambda: shared_session_request(session, url, params)),
+        ):
+            latencies = await sequential(request)
+            results[name] = (
+                statistics.mean(latencies),
+                statistics.quantiles(latencies, n=100)[98],
+                await fan_out(request),
+            )
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+    print(f"{'':16}{'mean (ms)':>12}{'p99 (ms)':>12}{f'{FAN_OUT}-track album (ms)':>24}")
+    for name, (mean, p99, album) in results.items():
+        print(f"{name:16}{mean:>12.3f}{p99:>12.3f}{album:>24.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
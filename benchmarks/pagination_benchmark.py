@@ -0,0 +1,116 @@
+"""Compares lazy page rendering against building every page up front with deepcopy
+
+Run from the repository root with ``python -m benchmarks.pagination_benchmark``.
+The input is 10,000 catalogue-style lines and the base embed carries a title,
+thumbnail and footer like the catalogue view. The deepcopy version builds every page
+before the paginator is sent. For the lazy source, "first page" is the work done
+before sending and "all pages" is a user paging through to the end.
+"""
+import asyncio
+import time
+import tracemalloc
+from copy import deepcopy
+
+from discord import Embed
+
+from bot_helpers.pagination import LinePageSource, pages_from_list, render_page
+
+LINES = 10_000
+REPEAT = 5
+
+
+def legacy_pages_from_list(base_embed: Embed, contents: list, max_lines=20):
+    """pages_from_list as it was before lazy rendering"""
+    pages = []
+
+    for idx, content in enumerate(contents, start=1):
+        if len(base_embed.description) + len(content) <= 2000 and idx % max_lines != 0:
+            base_embed.description += f"\n{content}"
+        else:
+            pages.append(base_embed)
+            base_embed = deepcopy(base_embed)
+            base_embed.description = content
+
+    if base_embed is not None and base_embed.description != "":
+        pages.append(base_embed)
+
+    return pages
+
+
+def base_embed():
+    return (
+        Embed(title="Someone's Catalogue", description="", colour=0x1DB954)
+        .set_thumbnail(url="https://cdn.discordapp.com/avatars/1/a.png")
+        .set_footer(
+            text="Requested by Someone",
+            icon_url="https://cdn.discordapp.com/avatars/2/b.png",
+        )
+    )
+
+
+def catalogue_lines():
+    for i in range(1, LINES + 1):
+        yield f"{i}. [Artist {i % 97} - Track title {i}](https://open.spotify.com/track/{i:022d}) | **track** - Catalogued by: Member {i % 13}"
+
+
+async def async_lines():
+    for line in catalogue_lines():
+        yield line
+
+
+async def legacy_all():
+    return legacy_pages_from_list(base_embed(), list(catalogue_lines()))
+
+
+async def eager_all():
+    return pages_from_list(base_embed(), list(catalogue_lines()))
+
+
+async def lazy_first(lines):
+    source = LinePageSource(lines())
+    await source.page_count()
+    return render_page(base_embed(), await source.get_lines(0))
+
+
+async def lazy_all(lines):
+    embed = base_embed()
+    source = LinePageSource(lines())
+    return [
+        render_page(embed, await source.get_lines(page))
+        for page in range(await source.page_count())
+    ]
+
+
+async def measure(func, *args):
+    await func(*args)
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        await func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    result = await func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+
+    return min(timings), peak / 1024
+
+
+async def main():
+    results = {
+        "deepcopy, all pages": await measure(legacy_all),
+        "shallow copy, all pages": await measure(eager_all),
+        "lazy, first page": await measure(lazy_first, catalogue_lines),
+        "lazy async, first page": await measure(lazy_first, async_lines),
+        "lazy, all pages": await measure(lazy_all, catalogue_lines),
+    }
+
+    print(f"{f'{LINES} lines':26}{'build (ms)':>12}{'peak (KiB)':>12}")
+    for name, (build, peak) in results.items():
+        print(f"{name:26}{build:>12.2f}{peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Compares registered prepared queries against Postgres.execute for single-row lookups
+
+Run from the repository root with ``python -m benchmarks.query_benchmark``. It needs
+DB_CONN to point at a database with the bot's tables and only reads from them. User
+IDs are sampled from the users table, lookups for missing rows cost the same.
+
+"execute" is the path every lookup took before the registry: a transaction around
+each statement and a generic Record. "registry" runs the statement prepared when the
+connection was opened, with no transaction, returning typed rows.
+"""
+import asyncio
+import statistics
+import time
+
+from bot_helpers import queries
+from bot_helpers.postgres import Postgres
+
+LOOKUPS = 2000
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+async def bench(lookup, user_ids):
+    await asyncio.gather(*(lookup(user_id) for user_id in user_ids[:50]))
+    latencies = [
+        await timed(lookup(user_ids[i % len(user_ids)])) for i in range(LOOKUPS)
+    ]
+    return statistics.mean(latencies), statistics.quantiles(latencies, n=100)[98]
+
+
+async def main():
+    db = Postgres(None)
+    await db.init_pool()
+
+    try:
+        user_ids = await db.execute(
+            """SELECT user_id FROM users LIMIT 500""", is_query=True, one_col=True
+        ) or ["0"]
+
+        lookups = {
+            "username, execute": lambda user_id: db.execute(
+                queries.LASTFM_USERNAME.statement,
+                user_id,
+                is_query=True,
+                one_val=True,
+            ),
+            "username, registry": lambda user_id: db.fetchval(
+                queries.LASTFM_USERNAME, user_id
+            ),
+            "by index, execute": lambda user_id: db.execute(
+                queries.CATALOGUE_ID_BY_INDEX.statement,
+                True,
+                user_id,
+                0,
+                is_query=True,
+                one_val=True,
+            ),
+            "by index, registry": lambda user_id: db.fetchval(
+                queries.CATALOGUE_ID_BY_INDEX, True, user_id, 0
+            ),
+        }
+
+        results = {
+            name: await bench(lookup, user_ids) for name, lookup in lookups.items()
+        }
+    finally:
+        await db.close_pool()
+
+    print(f"{f'{LOOKUPS} lookups':22}{'mean (ms)':>12}{'p99 (ms)':>12}")
+    for name, (mean, p99) in results.items():
+        print(f"{name:22}{mean:>12.3f}{p99:>12.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
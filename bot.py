@@ -1,16 +1,23 @@
 import os
 import discord
 import asyncio
+import asyncpg
+import httpx
 from discord.ext import commands
 import random
 import sys
+import time
 import traceback
 import tekore as tk
 from dotenv import load_dotenv
 from tekore._client.api import track
-from bot_helpers.utils import get_prefix  # pylint=disable-import-error
+from bot_helpers.utils import get_prefix, create_session, retry  # pylint=disable-import-error
 from bot_helpers.cache import BotCache
+from bot_helpers.completion import CompletionWorker
+from bot_helpers.members import MemberResolver
 from bot_helpers.postgres import Postgres
+from bot_helpers.spotify import SpotifyMetadata
+from bot_helpers.spotify_auth import CredentialsSender, SpotifyCredentials
 
 
 load_dotenv(verbose=True)
@@ -19,19 +26,115 @@ TOKEN = os.getenv("TOKEN")
 COMMAND_PREFIX = os.getenv("PREFIX")
 SPOTIFY_TOKEN = os.getenv("SPOT_TOKEN")
 SPOTIFY_SECRET = os.getenv("SPOT_SECRET")
+HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", 32))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", 8))
+STARTUP_ATTEMPTS = int(os.getenv("STARTUP_ATTEMPTS", 5))
+
+# Failures worth retrying during startup, such as the network or database not being up yet
+TRANSIENT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.TooManyConnectionsError,
+    httpx.TransportError,
+    tk.ServerError,
+)
 
 class KesaraBot(commands.Bot):
     def __init__(self, **kwargs):
         self.cache = BotCache(self)
         self.db = Postgres(self)
-        asyncio.get_event_loop().run_until_complete(self.db.init_pool())
-        spot_token = tk.request_client_token(SPOTIFY_TOKEN, SPOTIFY_SECRET)
-        self.spotify = tk.Spotify(spot_token, asynchronous=True)
+        self.session = None
+        self.spotify = None
+        self.spotify_credentials = SpotifyCredentials(SPOTIFY_TOKEN, SPOTIFY_SECRET)
+        self.metadata = SpotifyMetadata(self)
+        self.member_names = MemberResolver(self)
+        self.completion = CompletionWorker(self)
         super().__init__(**kwargs)
 
+    async def start(self, *args, **kwargs):
+        """Logs in while the startup pipeline runs, then connects to the gateway"""
+        reconnect = kwargs.pop("reconnect", True)
+        timings = {}
+        start = time.perf_counter()
+
+        await asyncio.gather(
+            self.startup_phase("login", timings, self.login, *args, **kwargs),
+            self.setup(timings),
+        )
+        timings["total"] = (time.perf_counter() - start) * 1000
+        print(
+            "Startup finished: "
+            + ", ".join(f"{name} {ms:.0f}ms" for name, ms in timings.items())
+        )
+
+        await self.connect(reconnect=reconnect)
+
+    async def setup(self, timings: dict):
+        """Opens the database pool, Spotify client and HTTP session concurrently, then loads the cogs"""
+        await asyncio.gather(
+            self.startup_phase("database", timings, self.db.init_pool),
+            self.startup_phase("spotify", timings, self.init_spotify),
+            self.startup_phase("http", timings, self.init_session),
+        )
+
+        start = time.perf_counter()
+        self.load_extensions()
+        timings["cogs"] = (time.perf_counter() - start) * 1000
+
+        self.loop.create_task(self.warm_cache())
+        self.completion.start()
+
+    async def startup_phase(self, name: str, timings: dict, func, *args, **kwargs):
+        """Runs one startup step, retrying transient failures, and records how long it took"""
+        start = time.perf_counter()
+        await retry(
+            func,
+            *args,
+            attempts=STARTUP_ATTEMPTS,
+            exceptions=TRANSIENT_ERRORS,
+            **kwargs,
+        )
+        timings[name] = (time.perf_counter() - start) * 1000
+
+    async def init_session(self):
+        self.session = create_session(HTTP_LIMIT, HTTP_LIMIT_PER_HOST)
+
+    async def init_spotify(self):
+        token = await self.spotify_credentials.get_token()
+        self.spotify = tk.Spotify(
+            token, sender=CredentialsSender(self.spotify_credentials)
+        )
+        self.spotify_credentials.start()
+
+    def load_extensions(self):
+        for extension in extensions:
+            try:
+                self.load_extension(f"cogs.{extension}")
+                print(f"Loaded extension: {extension}")
+            except Exception as e:
+                print(e)
+                traceback.print_exc()
+                print("Could not load extension")
+
+    async def warm_cache(self):
+        await self.wait_until_ready()
+        start = time.perf_counter()
+        prefixes, flags = await self.cache.preload(guild.id for guild in self.guilds)
+        print(
+            f"Cache warmed with {prefixes} prefixes and {flags} catalogue flags in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+
     async def close(self):
-        await self.db.close_pool()
-        await self.spotify.close()
+        self.completion.stop()
+        self.spotify_credentials.stop()
+        # Startup may have failed before every resource was opened
+        if self.db.pool is not None:
+            await self.db.close_pool()
+        if self.spotify is not None:
+            await self.spotify.close()
+        if self.session is not None:
+            await self.session.close()
         await super().close()
 
 bot = KesaraBot(command_prefix=get_prefix, owner_id=291666852533501952)
@@ -57,16 +160,4 @@ extensions = [
     "owner"
 ]
 
-if __name__ == "__main__":
-    print("Is main")
-    for extension in extensions:
-        print(extension)
-        try:
-            bot.load_extension(f"cogs.{extension}")
-            print(f"Loaded extension: {extension}")
-        except Exception as e:
-            print(e)
-            traceback.print_exc()
-            print("Could not load extension")
-
 bot.run(TOKEN)
@@ -1,137 +1,236 @@
-# Least-recently used cache implementation as written by Jerry An
-# https://levelup.gitconnected.com/design-an-least-recently-used-cache-in-python-2f2d4a3fee6d
-from types import FunctionType
-from discord.ext import commands
-from typing import Callable
+import asyncio
+from collections import OrderedDict
+from time import monotonic, perf_counter
+from typing import Awaitable, Callable, Optional
 
+from bot_helpers import queries
 
-class Node:
-    def __init__(self, key, value) -> None:
-        self.key = key
+_MISSING = object()
+
+
+class Entry:
+    __slots__ = ("val", "expires")
+
+    def __init__(self, value, expires=None) -> None:
         self.val = value
-        self.next = None
-        self.prev = None
+        self.expires = expires
 
 
 class LRUCache:
-    """Implementation of a least recently used cache in Python using a doubly-linked list alongside a hashmap
+    """Implementation of a least recently used cache on top of an OrderedDict, with O(1) lookups, moves and evictions
+
+    A None result from update_func is stored as a negative entry when negative_ttl is set,
+    so repeated lookups for keys with no backing row do not reach the backing store.
 
     :param capacity: Size of the cache
-    :param update_func: Function which updates the cache if a value is not found
+    :param update_func: Coroutine function which loads the value for a key if it is not found
+    :param ttl: Seconds a loaded value stays valid, None to keep it until evicted or invalidated
+    :param negative_ttl: Seconds a missing value stays cached, None to not cache missing values
     """
 
-    def __init__(self, capacity: int, update_func: Callable[[], None]):
+    def __init__(
+        self,
+        capacity: int,
+        update_func: Callable[..., Awaitable],
+        ttl: Optional[float] = None,
+        negative_ttl: Optional[float] = None,
+    ):
         self.capacity = capacity
-        self.search = {}
-        self.dummy = Node(0, 0)
-        self.head = self.dummy.next
-        self.tail = self.dummy.next
+        self.entries = OrderedDict()
         self.update_func = update_func
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.pending = {}
 
-    def remove_head(self):
-        """Remove the head node (least recently used)"""
-        if not self.head:
-            return
-        prev = self.head
-        self.head = self.head.next
-        if self.head:
-            self.head.prev = None
-        del prev
-
-    def append_new_node(self, new_node):
-        """Adds the new node to the tail (most recently used)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_time = 0.0
 
-        :param new_node: Node (key-value pair) to be added to the cache
-        :type: Node
-        """
-        if not self.tail:
-            self.head = self.tail = new_node
-        else:
-            self.tail.next = new_node
-            new_node.prev = self.tail
-            self.tail = self.tail.next
-
-    def unlink_cur_node(self, node):
-        """Removes a specified node from the list"""
-        if self.head is node:
-            self.head = node.next
-            if node.next:
-                node.next.prev = None
-            return
+    def __len__(self):
+        return len(self.entries)
 
-        # Removing the node from the middle of the list
-        prev_node, next_node = node.prev, node.next
-        prev_node.next = next_node
-        next_node.prev = prev_node
+    def get(self, key, fallback=None):
+        """Fetches value for a specific key without loading it, marking it most recently used
 
-    def get(self, key, fallback):
-        """Fetches value for a specific key from the linked list
-
-        :param key: Node identifier of any type
-        :param fallback: Returned if key is not found
-        :return: Node value
+        :param key: Entry identifier of any type
+        :param fallback: Returned if key is not found or has expired
+        :return: Entry value, None for a negative entry
         """
-        if key not in self.search and fallback is None:
-            return -1 if self.update_func is None else self.update_func(key)
-        elif key not in self.search:
+        entries = self.entries
+        entry = entries.get(key)
+        if entry is None:
+            self.misses += 1
             return fallback
 
-        node = self.search[key]
+        if entry.expires is not None and entry.expires <= monotonic():
+            del entries[key]
+            self.misses += 1
+            return fallback
 
-        if node is not self.tail:
-            self.unlink_cur_node(node)
-            self.append_new_node(node)
+        entries.move_to_end(key)
+        self.hits += 1
+        return entry.val
 
-        return node.val
+    async def fetch(self, key, *args):
+        """Fetches value for a specific key, loading it through update_func on a miss
 
-    def put(self, key, value):
-        """Adds a new node to the cache
+        Concurrent misses for the same key wait on a single load rather than
+        each querying the backing store.
 
-        :param key: Key for the node
-        :param value: Value for the node
+        :param key: Entry identifier of any type
+        :param args: Extra arguments passed on to update_func after the key
+        :return: Entry value, or None if update_func found nothing
         """
-        if key in self.search:
-            self.search[key].val = value
-            self.get(key)
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        load = self.pending.get(key)
+        if load is None:
+            load = asyncio.ensure_future(self._load(key, *args))
+            self.pending[key] = load
+
+        return await asyncio.shield(load)
+
+    async def _load(self, key, *args):
+        task = asyncio.current_task()
+        start = perf_counter()
+        try:
+            value = await self.update_func(key, *args)
+            # An invalidate() while loading means the value may already be stale
+            if self.pending.get(key) is task:
+                if value is not None:
+                    self.put(key, value)
+                elif self.negative_ttl is not None:
+                    self.put(key, None, self.negative_ttl)
+            return value
+        finally:
+            self.loads += 1
+            self.load_time += perf_counter() - start
+            if self.pending.get(key) is task:
+                del self.pending[key]
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        """Adds a new entry to the cache, evicting the least recently used entry if it is full
+
+        :param key: Key for the entry
+        :param value: Value for the entry
+        :param ttl: Seconds the value stays valid, defaults to the cache's ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = monotonic() + ttl if ttl is not None else None
+
+        entries = self.entries
+        entry = entries.get(key)
+        if entry is not None:
+            entry.val = value
+            entry.expires = expires
+            entries.move_to_end(key)
             return
 
-        if len(self.search) == self.capacity:
-            # Remove the head node and the corresponding key
-            self.search.pop(self.head.key)
-            self.remove_head()
+        if len(entries) >= self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
 
-        # Add the new node, key to the hashmap
-        new_node = Node(key, value)
-        self.search[key] = new_node
-        self.append_new_node(new_node)
+        entries[key] = Entry(value, expires)
+
+    def invalidate(self, key):
+        """Drops a key so the next fetch reloads it, called after writes to the backing store
+
+        :param key: Key for the entry
+        """
+        self.pending.pop(key, None)
+        self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """Returns hit, miss, eviction and load-latency counters for the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "loads": self.loads,
+            "avg_load_ms": self.load_time / self.loads * 1000 if self.loads else 0.0,
+        }
 
 
 class BotCache:
     def __init__(self, bot):
-        self.prefixes = LRUCache(2048, self.get_prefix_db)
-        self.catalogue_users = LRUCache(2048, self.get_catalogue_enabled)
+        self.prefixes = LRUCache(2048, self.get_prefix_db, ttl=3600, negative_ttl=300)
+        self.catalogue_users = LRUCache(
+            2048, self.get_catalogue_enabled_db, ttl=3600, negative_ttl=300
+        )
+        self.shuffle_channels = LRUCache(
+            2048, self.get_quote_shuffle_db, ttl=3600, negative_ttl=300
+        )
         self.bot = bot
 
-    def get_prefix_db(self, key) -> str:
-        prefix = self.bot.db.sync_execute(
-            """
-            SELECT prefix FROM guilds WHERE guild_id=(%s)
-            """,
-            [str(key)],
-            is_query=True,
-            one_row=True,
-        )
-        self.prefixes.put(key, prefix)
-        return prefix
-
-    def get_catalogue_enabled(self, key) -> bool:
-        is_enabled = self.bot.db.sync_execute(
-            """
-            SELECT catalogue_enabled FROM users WHERE user_id=(%s)
-            """,
-            [str(key)],
-            is_query=True,
-            one_row=True,
+    async def get_prefix(self, guild_id) -> str:
+        return await self.prefixes.fetch(str(guild_id))
+
+    async def get_catalogue_enabled(self, user_id) -> bool:
+        return bool(await self.catalogue_users.fetch(str(user_id)))
+
+    async def get_quote_shuffle(self, channel_id) -> bool:
+        return bool(await self.shuffle_channels.fetch(str(channel_id)))
+
+    def invalidate_prefix(self, guild_id):
+        self.prefixes.invalidate(str(guild_id))
+
+    def invalidate_catalogue_enabled(self, user_id):
+        self.catalogue_users.invalidate(str(user_id))
+
+    def invalidate_quote_shuffle(self, channel_id):
+        self.shuffle_channels.invalidate(str(channel_id))
+
+    async def preload(self, guild_ids) -> tuple:
+        """Bulk-loads stored prefixes and catalogue flags so a restart does not start cold
+
+        :param guild_ids: IDs of the guilds the bot can see, only their prefixes are loaded
+        :return: Number of prefixes and catalogue flags loaded
+        """
+        counts = await asyncio.gather(
+            self.stream_into(
+                self.prefixes,
+                """
+                SELECT guild_id, prefix FROM guilds
+                WHERE guild_id = ANY($1::text[])
+                AND prefix IS NOT NULL
+                LIMIT $2
+                """,
+                [str(guild_id) for guild_id in guild_ids],
+                self.prefixes.capacity,
+            ),
+            self.stream_into(
+                self.catalogue_users,
+                """
+                SELECT user_id, catalogue_enabled FROM users
+                WHERE catalogue_enabled IS NOT NULL
+                LIMIT $1
+                """,
+                self.catalogue_users.capacity,
+            ),
         )
-        self.catalogue_users.put(key, is_enabled)
-        return is_enabled
+        return tuple(counts)
+
+    async def stream_into(self, cache: LRUCache, statement: str, *params) -> int:
+        """Puts each (key, value) row of a query into a cache as it is streamed in"""
+        count = 0
+        async for key, value in self.bot.db.iterate(statement, *params):
+            cache.put(key, value)
+            count += 1
+        return count
+
+    async def get_prefix_db(self, key) -> str:
+        return await self.bot.db.fetchval(queries.GUILD_PREFIX, key)
+
+    async def get_catalogue_enabled_db(self, key) -> bool:
+        return await self.bot.db.fetchval(queries.CATALOGUE_ENABLED, key)
+
+    async def get_quote_shuffle_db(self, key) -> bool:
+        return await self.bot.db.fetchval(queries.QUOTE_SHUFFLE_CHANNEL, key)
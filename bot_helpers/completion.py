@@ -0,0 +1,500 @@
+import asyncio
+import os
+import re
+import time
+import traceback
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+import discord
+from bot_helpers.scheduler import BULK
+from cogs.lastfm import NotFound
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+# Seconds between background checks of the same user
+COMPLETION_PERIOD = float(os.getenv("COMPLETION_PERIOD", 6 * 3600))
+# Last.fm requests per hour the background worker may spend
+COMPLETION_BUDGET = float(os.getenv("COMPLETION_BUDGET", 1800))
+# Minimum seconds between two background checks
+COMPLETION_SPACING = float(os.getenv("COMPLETION_SPACING", 10))
+# Seconds before a user whose check failed is tried again, doubled for each failure
+# in a row up to COMPLETION_PERIOD
+COMPLETION_RETRY = float(os.getenv("COMPLETION_RETRY", 900))
+
+# Last.fm returns at most 200 scrobbles per user.getRecentTracks page
+RECENT_TRACKS_LIMIT = 200
+# Album tracks looked up at once when per-track playcounts are needed
+TRACK_BATCH = 5
+
+_VERSION_SUFFIX = re.compile(
+    r"\s+-\s+.*\b(remaster(ed)?|version|edit|mix|live|mono|stereo|demo)\b.*$"
+)
+_BRACKETED = re.compile(r"[\(\[][^\)\]]*[\)\]]")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalise(text: str) -> str:
+    """Reduces a track or artist name to a form that matches across Spotify and Last.fm
+
+    Case, punctuation, bracketed notes such as (feat. ...) and " - Remastered" style
+    suffixes are dropped.
+    """
+    text = _VERSION_SUFFIX.sub("", text.casefold())
+    text = _PUNCTUATION.sub("", _BRACKETED.sub("", text))
+    return " ".join(text.split())
+
+
+class CatalogueIndex:
+    """In-memory index of a user's catalogue, keyed on normalised artist and track names
+
+    Scrobbles fed through add() are matched against every track and album in the
+    catalogue which contains that track by one of its artists.
+
+    :param records: (type, music_id, artists, name, tracks) for each catalogue item
+    """
+
+    def __init__(self, records):
+        self.items = defaultdict(list)
+        self.plays = {}
+        self.unheard = {}
+
+        for music_type, music_id, artists, name, tracks in records:
+            track_names = [name] if music_type == "track" else tracks
+            self.plays[music_id] = 0
+            self.unheard[music_id] = {normalise(track): track for track in track_names}
+
+            for artist in {normalise(artist) for artist in artists}:
+                for track in self.unheard[music_id]:
+                    self.items[(artist, track)].append(music_id)
+
+    def add(self, artist: str, track: str):
+        """Records one scrobble against every catalogue item it belongs to"""
+        track = normalise(track)
+        for music_id in self.items.get((normalise(artist), track), ()):
+            self.plays[music_id] += 1
+            self.unheard[music_id].pop(track, None)
+
+    def progress(self, music_id: str) -> Tuple[int, List[str]]:
+        """Returns the scrobbles matched to an item and the names of its tracks not yet heard"""
+        return self.plays[music_id], list(self.unheard[music_id].values())
+
+
+async def recent_scrobbles(
+    lastfm, username: str, since: int, priority=BULK
+) -> Optional[Tuple[List[Tuple[str, str]], int]]:
+    """Pages through a user's scrobbles made after a timestamp
+
+    :param lastfm: The LastFM cog, used to send the requests
+    :param since: UNIX timestamp of the newest scrobble already processed
+    :return: (artist, track) for each scrobble and the newest scrobble's timestamp,
+        or None if any page could not be fetched
+    """
+    params = {
+        "method": "user.getRecentTracks",
+        "user": username,
+        "from": str(since + 1),
+        "limit": str(RECENT_TRACKS_LIMIT),
+    }
+
+    try:
+        first = await lastfm.request_lastfm({**params, "page": "1"}, priority)
+    except NotFound:
+        # A username Last.fm does not know has no scrobbles to wait for
+        return [], since
+    if first is None:
+        return None
+
+    newest = max([since] + [uts for _, _, uts in page_scrobbles(first)])
+
+    # Scrobbles made while the other pages are fetched would shift them, so every
+    # page is pinned to the newest scrobble on the first
+    params["to"] = str(newest + 1)
+    total_pages = int(first["recenttracks"]["@attr"]["totalPages"])
+    pages = [first] + await asyncio.gather(
+        *[
+            lastfm.request_lastfm({**params, "page": str(page)}, priority)
+            for page in range(2, total_pages + 1)
+        ]
+    )
+    if None in pages:
+        return None
+
+    scrobbles = [
+        (artist, track)
+        for page in pages
+        for artist, track, uts in page_scrobbles(page)
+        if uts <= newest
+    ]
+    return scrobbles, newest
+
+
+def page_scrobbles(page) -> List[Tuple[str, str, int]]:
+    """Returns (artist, track, timestamp) for each scrobble on a user.getRecentTracks page"""
+    tracks = page["recenttracks"]["track"]
+    # A page holding a single scrobble is returned as an object rather than a list
+    return [
+        (track["artist"]["#text"], track["name"], int(track["date"]["uts"]))
+        for track in ([tracks] if isinstance(tracks, dict) else tracks)
+        # The currently playing track has no date and is not a scrobble yet
+        if "date" in track
+    ]
+
+
+class CompletionWorker:
+    """Background subsystem which finds completed catalogue items ahead of catalogue check
+
+    Catalogue-enabled users are checked one at a time, least recently checked first,
+    and each check is followed by a pause proportional to the Last.fm requests it
+    made, keeping the worker within COMPLETION_BUDGET requests per hour. Completed
+    items are moved from catalogue into catalogue_completions for check to read, and
+    users who opted in are sent a DM.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.task = None
+        self.requested = {}
+        self.wakeup = asyncio.Event()
+
+    def start(self):
+        if self.task is None:
+            self.task = self.bot.loop.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def request(self, user_id, full: bool = False):
+        """Queues a user to be checked ahead of the background rotation
+
+        :param full: Recount lifetime plays instead of scanning recent scrobbles
+        """
+        user_id = str(user_id)
+        self.requested[user_id] = self.requested.get(user_id, False) or full
+        self.wakeup.set()
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+
+        while True:
+            try:
+                delay = await self.check_next()
+            except Exception:
+                traceback.print_exc()
+                delay = COMPLETION_RETRY
+            await self.idle(delay)
+
+    async def check_next(self) -> float:
+        """Checks the next requested or due user
+
+        :return: Seconds to wait before the next check
+        """
+        if self.requested:
+            user_id, full = next(iter(self.requested.items()))
+            del self.requested[user_id]
+        else:
+            user_id, full = await self.next_due_user(), False
+
+        if user_id is None:
+            return COMPLETION_PERIOD / 10
+
+        lastfm = self.bot.get_cog("lastfm")
+        before = lastfm.requests
+        try:
+            completed = await self.check_user(user_id, full)
+        except Exception:
+            traceback.print_exc()
+            await self.mark_failed(user_id)
+            completed = 0
+
+        if completed:
+            await self.notify(user_id, completed)
+
+        cost = lastfm.requests - before
+        return max(cost * 3600 / COMPLETION_BUDGET, COMPLETION_SPACING)
+
+    async def idle(self, delay: float):
+        """Sleeps for delay seconds, or until a check is requested"""
+        if self.requested:
+            return
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup.clear()
+
+    async def next_due_user(self) -> Optional[str]:
+        user_id = await self.bot.db.execute(
+            """
+            SELECT user_id FROM users
+            WHERE catalogue_enabled
+            AND last_fm IS NOT NULL
+            AND (
+                completion_checked_at IS NULL
+                OR completion_checked_at < now() - make_interval(secs => $1)
+            )
+            ORDER BY completion_checked_at NULLS FIRST
+            LIMIT 1
+            """,
+            COMPLETION_PERIOD,
+            is_query=True,
+            one_val=True,
+        )
+        return user_id if user_id != () else None
+
+    async def check_user(self, user_id: str, full: bool = False) -> int:
+        """Checks one user's approved catalogue items and records the completed ones
+
+        :return: Number of items completed since the last check
+        """
+        username, checked_at = await self.bot.db.execute(
+            """
+            SELECT last_fm, lastfm_checked_at FROM users WHERE user_id = $1
+            """,
+            user_id,
+            is_query=True,
+            one_row=True,
+        ) or (None, None)
+
+        if username is None:
+            await self.mark_checked(user_id, checked_at)
+            return 0
+
+        music_info = await self.bot.db.execute(
+            """
+            SELECT type, music_id, artists, name, added_by, tracks, added_at
+            FROM catalogue
+            WHERE user_id = $1
+            AND approved = $2
+            """,
+            user_id,
+            True,
+            is_query=True,
+        )
+
+        if checked_at is None or full:
+            playcounts = await asyncio.gather(
+                *[
+                    self.get_music_plays(username, *tuple(record)[:4], record[5])
+                    for record in music_info
+                ]
+            )
+            # A lookup that failed for a reason which may pass, such as a network or
+            # server error, leaves its item unchecked, so the watermark stays put
+            # and the next check counts lifetime plays again
+            failed = None in playcounts
+            if not failed:
+                checked_at = int(time.time())
+        else:
+            recent = await self.get_recent_plays(username, music_info, checked_at)
+            if recent is None:
+                await self.mark_failed(user_id)
+                return 0
+            playcounts, checked_at = recent
+            failed = False
+
+        completed_items = {
+            rec[1]: count for rec, count in zip(music_info, playcounts) if count
+        }
+
+        async with self.bot.db.transaction("record completions") as con:
+            if completed_items != {}:
+                # Snapshot the completed rows into the results and remove them in one statement
+                await con.execute(
+                    """
+                    WITH completed AS (
+                        DELETE FROM catalogue
+                        USING unnest($2::text[], $3::integer[]) AS done (music_id, plays)
+                        WHERE catalogue.user_id = $1
+                        AND catalogue.music_id = done.music_id
+                        RETURNING catalogue.user_id, catalogue.type, catalogue.music_id,
+                            catalogue.artists, catalogue.name, catalogue.added_by, done.plays
+                    )
+                    INSERT INTO catalogue_completions (user_id, type, music_id, artists, name, added_by, plays)
+                        SELECT * FROM completed
+                    ON CONFLICT (user_id, music_id) DO UPDATE
+                        SET plays = excluded.plays, completed_at = now()
+                    """,
+                    user_id,
+                    list(completed_items.keys()),
+                    list(completed_items.values()),
+                )
+
+            if not failed:
+                await self.mark_checked(user_id, checked_at, con)
+
+        if failed:
+            await self.mark_failed(user_id)
+
+        return len(completed_items)
+
+    async def mark_checked(self, user_id: str, checked_at: Optional[int], con=None):
+        statement = """
+            UPDATE users
+            SET lastfm_checked_at = $2,
+                completion_checked_at = now(),
+                completion_failures = 0
+            WHERE user_id = $1
+            """
+        if con is not None:
+            await con.execute(statement, user_id, checked_at)
+        else:
+            await self.bot.db.execute(statement, user_id, checked_at)
+
+    async def mark_failed(self, user_id: str):
+        """Moves a user whose check failed back in the rotation
+
+        The user is due again after COMPLETION_RETRY seconds, doubled for each failure
+        in a row, so a user whose checks keep failing ends up checked once every
+        COMPLETION_PERIOD like everyone else. lastfm_checked_at is left alone so the
+        next check covers the same scrobbles.
+        """
+        await self.bot.db.execute(
+            """
+            UPDATE users
+            SET completion_failures = completion_failures + 1,
+                completion_checked_at = now() - make_interval(
+                    secs => $2 - least($3 * 2 ^ least(completion_failures, 20), $2)
+                )
+            WHERE user_id = $1
+            """,
+            user_id,
+            COMPLETION_PERIOD,
+            COMPLETION_RETRY,
+        )
+
+    async def notify(self, user_id: str, completed: int):
+        wants_notification = await self.bot.db.execute(
+            """
+            SELECT catalogue_notify FROM users WHERE user_id = $1
+            """,
+            user_id,
+            is_query=True,
+            one_val=True,
+        )
+        if wants_notification is not True:
+            return
+
+        try:
+            user = self.bot.get_user(int(user_id)) or await self.bot.fetch_user(
+                int(user_id)
+            )
+            await user.send(
+                f"You have completed {completed} {'items' if completed > 1 else 'item'} in your catalogue! Use catalogue check to see which."
+            )
+        except (discord.NotFound, discord.Forbidden):
+            pass
+
+    async def get_music_plays(
+        self, username, music_type, music_id, artists, name, tracks=None
+    ):
+        lastfm = self.bot.get_cog("lastfm")
+
+        if music_type == "track":
+            count = await lastfm.get_playcount(
+                artists[0], name, music_type, username, BULK
+            )
+            return count
+
+        elif music_type == "album":
+
+            # Rows saved before tracks were stored fall back to Spotify
+            if tracks is None:
+                tracks = (await self.bot.metadata.get(music_type, music_id)).tracks
+
+            # Last.fm's tracklist names tracks the way their scrobbles are recorded,
+            # Spotify's names often carry suffixes such as " - Remastered 2011" which
+            # track.getInfo does not know. Albums Last.fm does not know keep Spotify's.
+            lastfm_tracks = await lastfm.get_album_tracks(artists[0], name, BULK)
+            if lastfm_tracks is None:
+                return None
+
+            # The album's own playcount misses plays scrobbled under other editions of
+            # it, so only the per-track counts can tell whether every track was heard
+            return await self.get_track_plays(
+                username, artists[0], lastfm_tracks or tracks
+            )
+
+    async def get_track_plays(self, username, artist, tracks) -> int:
+        """Sums the plays of several tracks, giving up at the first one never played
+
+        Tracks are looked up TRACK_BATCH at a time, so an incomplete album stops
+        costing requests soon after its first unplayed track.
+
+        :return: Total plays of the tracks, 0 if any of them has never been played,
+            or None if a playcount could not be fetched for a reason which may pass
+        """
+        lastfm = self.bot.get_cog("lastfm")
+        total = 0
+
+        for start in range(0, len(tracks), TRACK_BATCH):
+            counts = await asyncio.gather(
+                *[
+                    lastfm.get_playcount(artist, track, "track", username, BULK)
+                    for track in tracks[start : start + TRACK_BATCH]
+                ]
+            )
+            if 0 in counts:
+                return 0
+            if None in counts:
+                return None
+            total += sum(counts)
+
+        return total
+
+    async def get_recent_plays(self, username, music_info, since: int):
+        """Counts plays of each catalogue item using only the scrobbles made after since
+
+        Items saved after since may have been played in full before it, so their
+        lifetime plays are looked up once instead.
+
+        :return: Playcount of each item (0 unless completed) and the timestamp to check
+            from next time, or None if Last.fm could not be reached
+        """
+        lastfm = self.bot.get_cog("lastfm")
+        recent = await recent_scrobbles(lastfm, username, since)
+        if recent is None:
+            return None
+        scrobbles, newest = recent
+
+        records = []
+        added = {}
+        for music_type, music_id, artists, name, _, tracks, added_at in music_info:
+            if music_type == "album" and tracks is None:
+                tracks = (await self.bot.metadata.get(music_type, music_id)).tracks
+            records.append((music_type, music_id, artists, name, tracks))
+
+            added_at = int(added_at.timestamp())
+            if added_at > since:
+                added[len(records) - 1] = self.get_music_plays(
+                    username, music_type, music_id, artists, name, tracks
+                )
+                # Moving past the item's save time keeps it from being looked up again
+                newest = max(newest, added_at)
+
+        index = CatalogueIndex(records)
+        for artist, track in scrobbles:
+            index.add(artist, track)
+
+        playcounts = []
+        partial = {}
+        for idx, (music_type, music_id, artists, name, _) in enumerate(records):
+            plays, unheard = index.progress(music_id)
+            playcounts.append(plays if unheard == [] else 0)
+
+            # Album tracks not heard since the last check may have been heard before it
+            if plays != 0 and unheard != [] and idx not in added:
+                partial[idx] = self.get_track_plays(username, artists[0], unheard)
+
+        counts = await asyncio.gather(*partial.values(), *added.values())
+        if None in counts:
+            return None
+        for idx, count in zip(partial, counts):
+            if count != 0:
+                playcounts[idx] = index.progress(records[idx][1])[0]
+        for idx, count in zip(added, counts[len(partial) :]):
+            playcounts[idx] = count
+
+        return playcounts, newest
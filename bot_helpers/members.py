@@ -0,0 +1,91 @@
+import asyncio
+import os
+from typing import Dict, Iterable
+
+import discord
+from bot_helpers.cache import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", 4096))
+MEMBER_CACHE_TTL = float(os.getenv("MEMBER_CACHE_TTL", 900))
+
+# Gateway member requests accept at most 100 user IDs
+QUERY_CHUNK = 100
+FETCH_CONCURRENCY = 5
+UNKNOWN_MEMBER = "Unknown member"
+
+
+class MemberResolver:
+    """Resolves user IDs to display names for a guild, for list commands
+
+    Names come from the gateway member cache where possible, then from chunked
+    gateway member requests, and only then from per-member REST fetches. Resolved
+    names are kept for MEMBER_CACHE_TTL seconds.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.names = LRUCache(
+            MEMBER_CACHE_SIZE, self.load, ttl=MEMBER_CACHE_TTL, negative_ttl=60
+        )
+        self.fetch_limit = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def display_name(self, guild, user_id) -> str:
+        names = await self.display_names(guild, [user_id])
+        return names[str(user_id)]
+
+    async def display_names(self, guild, user_ids: Iterable) -> Dict[str, str]:
+        """Resolves many user IDs at once, each distinct ID at most once
+
+        :return: Display names keyed by user ID as a string
+        """
+        names = {}
+        missing = []
+
+        for user_id in dict.fromkeys(str(user_id) for user_id in user_ids):
+            # None is a cached "not a member", False means nothing is cached
+            name = self.names.get((guild.id, user_id), False)
+            if name is False:
+                member = guild.get_member(int(user_id))
+                if member is not None:
+                    name = member.display_name
+                    self.names.put((guild.id, user_id), name)
+
+            if name is False:
+                missing.append(user_id)
+            else:
+                names[user_id] = name if name is not None else UNKNOWN_MEMBER
+
+        if missing and self.bot.intents.members:
+            for start in range(0, len(missing), QUERY_CHUNK):
+                chunk = missing[start : start + QUERY_CHUNK]
+                try:
+                    members = await guild.query_members(
+                        user_ids=[int(user_id) for user_id in chunk], limit=len(chunk)
+                    )
+                except asyncio.TimeoutError:
+                    continue
+
+                for member in members:
+                    names[str(member.id)] = member.display_name
+                    self.names.put((guild.id, str(member.id)), member.display_name)
+
+            missing = [user_id for user_id in missing if user_id not in names]
+
+        fetched = await asyncio.gather(
+            *[self.names.fetch((guild.id, user_id), guild) for user_id in missing]
+        )
+        for user_id, name in zip(missing, fetched):
+            names[user_id] = name if name is not None else UNKNOWN_MEMBER
+
+        return names
+
+    async def load(self, key, guild):
+        user_id = key[1]
+        async with self.fetch_limit:
+            try:
+                member = await guild.fetch_member(int(user_id))
+            except (discord.NotFound, discord.Forbidden):
+                return None
+        return member.display_name
@@ -1,6 +1,7 @@
 from pygicord import Paginator
 from discord import Embed
-from copy import deepcopy
+from copy import copy
+from typing import AsyncIterable, Iterable, Iterator, List, Union
 
 custom_emojis = {
     "\U000023EA": "REPLACE (first page",
@@ -13,24 +14,135 @@ custom_emojis = {
 }
 
 
-def pages_from_list(base_embed: Embed, contents: list, max_lines=20):
-    pages = []
+# Embed descriptions are capped below Discord's limit to keep pages readable
+MAX_PAGE_CHARS = 2000
+
 
-    for idx, content in enumerate(contents, start=1):
-        if len(base_embed.description) + len(content) <= 2000 and idx % max_lines != 0:
-            base_embed.description += f"\n{content}"
-        else:
-            pages.append(base_embed)
-            base_embed = deepcopy(base_embed)
-            base_embed.description = content
+def group_lines(
+    lines: Iterable[str], max_lines=20, max_chars=MAX_PAGE_CHARS
+) -> Iterator[List[str]]:
+    """Packs lines into pages of at most max_lines lines and max_chars characters"""
+    page = []
+    size = 0
+    for line in lines:
+        if page and (len(page) == max_lines or size + len(line) + 1 > max_chars):
+            yield page
+            page = []
+            size = 0
+        page.append(line)
+        size += len(line) + 1
 
-    if base_embed is not None and base_embed.description != "":
-        pages.append(base_embed)
+    if page:
+        yield page
 
-    return pages
+
+def pages_from_list(base_embed: Embed, contents: list, max_lines=20):
+    return [render_page(base_embed, page) for page in group_lines(contents, max_lines)]
 
 
 async def send_pages(ctx, base_embed, contents, max_lines=20):
-    pages = pages_from_list(base_embed, contents, max_lines)
-    paginator = Paginator(pages=pages, emojis=custom_emojis)
+    await send_lazy_pages(ctx, base_embed, LinePageSource(contents, max_lines))
+
+
+class PageSource:
+    """Base class for paginator sources which fetch their lines one page at a time
+
+    :param per_page: Number of lines on each page
+    """
+
+    def __init__(self, per_page=10):
+        self.per_page = per_page
+
+    async def count(self) -> int:
+        """Returns the total number of lines"""
+        raise NotImplementedError
+
+    async def page_count(self) -> int:
+        return -(-await self.count() // self.per_page)
+
+    async def get_lines(self, page: int) -> List[str]:
+        """Returns the lines on a page, counting pages from 0"""
+        raise NotImplementedError
+
+
+class LinePageSource(PageSource):
+    """Pages over a list, iterator or async iterator of lines already formatted for display
+
+    The lines are read once, when the number of pages is first needed, and kept as
+    plain strings; embeds are only built for the pages that are shown.
+
+    :param max_lines: Maximum number of lines on each page
+    """
+
+    def __init__(self, lines: Union[Iterable[str], AsyncIterable[str]], max_lines=20):
+        super().__init__(max_lines)
+        self.lines = lines
+        self.pages = None
+
+    async def page_count(self) -> int:
+        if self.pages is None:
+            lines = self.lines
+            if hasattr(lines, "__aiter__"):
+                lines = [line async for line in lines]
+            self.pages = list(group_lines(lines, self.per_page))
+            self.lines = None
+        return len(self.pages)
+
+    async def get_lines(self, page: int) -> List[str]:
+        await self.page_count()
+        return self.pages[page]
+
+
+class LazyPaginator(Paginator):
+    """Paginator which fetches and renders each page from a PageSource only when it is first shown"""
+
+    def __init__(
+        self,
+        base_embed: Embed,
+        source: PageSource,
+        page_count: int,
+        first_page: Embed,
+        **kwargs,
+    ):
+        self.base_embed = base_embed
+        self.source = source
+        self.page_count = page_count
+        super().__init__(pages={0: first_page}, **kwargs)
+
+    def __len__(self):
+        return self.page_count
+
+    async def show_page(self, index: int) -> None:
+        if 0 <= index < len(self) and index not in self.pages:
+            self.pages[index] = render_page(
+                self.base_embed, await self.source.get_lines(index)
+            )
+        await super().show_page(index)
+
+
+def render_page(base_embed: Embed, lines: List[str]) -> Embed:
+    """Builds a page from a shallow copy of the base embed
+
+    Only the description differs between pages, so the title, thumbnail and footer
+    of every page share the base embed's objects.
+    """
+    page = copy(base_embed)
+    page.description = "\n".join(lines)
+    return page
+
+
+async def send_lazy_pages(ctx, base_embed: Embed, source: PageSource) -> bool:
+    """Starts a paginator over a PageSource, fetching only the first page up front
+
+    :return: False if the source has no lines, in which case nothing is sent
+    """
+    page_count = await source.page_count()
+    if page_count == 0:
+        return False
+
+    first_page = render_page(base_embed, await source.get_lines(0))
+    paginator = LazyPaginator(
+        base_embed, source, page_count, first_page, emojis=custom_emojis
+    )
     await paginator.start(ctx)
+    return True
@@ -1,21 +1,189 @@
 import asyncpg
-import psycopg2
 import os
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from time import perf_counter
+from typing import Dict, List, Optional
+from bot_helpers.queries import QUERIES, Query, Row
 from dotenv import load_dotenv
 
 load_dotenv(verbose=True)
 DB_CONN = os.getenv("DB_CONN")
+# Sized for a small host such as a Raspberry Pi, raise DB_POOL_MAX on bigger machines
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+# Seconds an idle connection is kept open above DB_POOL_MIN
+DB_POOL_IDLE = float(os.getenv("DB_POOL_IDLE", 300))
+# Seconds to wait for a free connection, and for a statement to finish
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", 10))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 10))
+# Statements taking longer than this many milliseconds are logged
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 250))
+
+# Rows fetched per round trip by Postgres.iterate
+ITERATE_BATCH = 500
+
+# Upper bounds in milliseconds of the latency histogram buckets
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+
+
+@lru_cache(maxsize=512)
+def statement_label(statement: str) -> str:
+    """Collapses a statement onto one line to key its metrics"""
+    return " ".join(statement.split())
+
+
+def shorten(label: str, width: int = 80) -> str:
+    """Truncates a metrics label for display"""
+    return label if len(label) <= width else f"{label[:width - 3]}..."
+
+
+class Histogram:
+    """Latency histogram over fixed millisecond BUCKETS"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile as the upper bound of the bucket it falls in"""
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+
+
+class PoolMetrics:
+    """Connection acquire waits and statement durations recorded by Postgres
+
+    Registered queries are keyed by their name and any other statement by its whole
+    statement_label, so every call site running the same SQL shares one histogram.
+    Transactions are keyed by the name passed to Postgres.transaction.
+    """
+
+    def __init__(self):
+        self.acquire = Histogram()
+        self.statements: Dict[str, Histogram] = defaultdict(Histogram)
+        self.slow = 0
+
+    def record(self, label: str, ms: float):
+        self.statements[label].observe(ms)
+        if ms >= DB_SLOW_QUERY_MS:
+            self.slow += 1
+            print(f"Slow query ({ms:.1f}ms): {shorten(label)}")
+
+
+class QueryConnection(asyncpg.Connection):
+    """Connection holding a prepared statement for each registered Query"""
+
+    __slots__ = ("prepared",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = {}
+
+    async def prepare_query(self, query: Query):
+        statement = self.prepared.get(query)
+        if statement is None:
+            statement = await self.prepare(
+                query.statement, record_class=query.record_class
+            )
+            self.prepared[query] = statement
+        return statement
 
 
 class Postgres:
     def __init__(self, bot) -> None:
         self.pool = None
-        self.sync_conn = psycopg2.connect(DB_CONN)
+        self.metrics = PoolMetrics()
 
     async def init_pool(self) -> None:
-        self.pool = await asyncpg.create_pool(dsn=DB_CONN)
+        self.pool = await asyncpg.create_pool(
+            dsn=DB_CONN,
+            min_size=DB_POOL_MIN,
+            max_size=DB_POOL_MAX,
+            max_inactive_connection_lifetime=DB_POOL_IDLE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            connection_class=QueryConnection,
+            init=self.prepare_queries,
+        )
         print("Pool initialized")
 
+    @asynccontextmanager
+    async def acquire(self):
+        """Takes a connection from the pool, recording how long the wait was"""
+        start = perf_counter()
+        async with self.pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as con:
+            self.metrics.acquire.observe((perf_counter() - start) * 1000)
+            yield con
+
+    @asynccontextmanager
+    async def timed(self, label: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.metrics.record(label, (perf_counter() - start) * 1000)
+
+    def pool_stats(self) -> Dict[str, int]:
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "min": self.pool.get_min_size(),
+            "max": self.pool.get_max_size(),
+        }
+
+    async def prepare_queries(self, con: QueryConnection):
+        """Prepares every registered Query on a new pool connection"""
+        for query in QUERIES:
+            try:
+                await con.prepare_query(query)
+            except asyncpg.PostgresError as e:
+                # Typically a migration that has not been applied yet, the query
+                # is prepared again, and fails properly, when it is first run
+                print(f"Could not prepare query: {e}")
+
+    async def run_query(self, query: Query, method: str, *params):
+        async with self.acquire() as con:
+            statement = await con.prepare_query(query)
+            run = getattr(statement, method)
+            async with self.timed(query.name):
+                if query.read_only:
+                    return await run(*params, timeout=query.timeout)
+                async with con.transaction():
+                    return await run(*params, timeout=query.timeout)
+
+    async def fetch(self, query: Query, *params) -> List[Row]:
+        return await self.run_query(query, "fetch", *params)
+
+    async def fetchrow(self, query: Query, *params) -> Optional[Row]:
+        return await self.run_query(query, "fetchrow", *params)
+
+    async def fetchval(self, query: Query, *params):
+        """Returns the first column of the first row, or None if there are no rows"""
+        return await self.run_query(query, "fetchval", *params)
+
     async def close_pool(self):
         await self.pool.close()
 
@@ -26,46 +194,72 @@ class Postgres:
         is_query=False,
         one_val=False,
         one_row=False,
-        one_col=False
+        one_col=False,
+        timeout=None
     ):
-        async with self.pool.acquire() as con:
+        """Runs a statement in its own transaction
+
+        :param timeout: Seconds before the statement is cancelled, DB_COMMAND_TIMEOUT if None
+        """
+        async with self.acquire() as con, self.timed(statement_label(statement)):
             async with con.transaction():
                 if is_query:
                     if one_val:
-                        data = await con.fetchval(statement, *params)
+                        data = await con.fetchval(statement, *params, timeout=timeout)
                     elif one_row:
-                        data = await con.fetchrow(statement, *params)
+                        data = await con.fetchrow(statement, *params, timeout=timeout)
                     elif one_col:
                         data = [
-                            result[0] async for result in con.cursor(statement, *params)
+                            record[0]
+                            for record in await con.fetch(
+                                statement, *params, timeout=timeout
+                            )
                         ]
                     else:
-                        data = await con.fetch(statement, *params)
+                        data = await con.fetch(statement, *params, timeout=timeout)
                     return data if data is not None else ()
                 else:
-                    await con.execute(statement, *params)
+                    await con.execute(statement, *params, timeout=timeout)
                     return ()
 
     async def executemany(self, statement, *params):
-        async with self.pool.acquire() as con:
+        async with self.acquire() as con, self.timed(statement_label(statement)):
             async with con.transaction():
-                con.executemany(statement, params)
+                await con.executemany(statement, params)
             return ()
 
-    async def iterate(self, statement, *params):
-        async with self.pool.acquire() as con:
+    @asynccontextmanager
+    async def transaction(self, name: str = "unnamed"):
+        """Holds one connection and transaction open for several mutations
+
+        Usage::
+
+            async with bot.db.transaction("add quote") as con:
+                await con.execute(...)
+                await con.executemany(...)
+
+        Everything inside the block is committed together, or rolled back if it raises.
+
+        :param name: Labels the transaction's duration in the pool metrics
+        """
+        async with self.acquire() as con, self.timed(f"transaction: {name}"):
             async with con.transaction():
-                async with con.cursor() as curs:
-                    pass
-
-    def sync_execute(self, statement: str, params: tuple, is_query=False, one_row=False, one_col=False):
-        with self.sync_conn.cursor() as curs:
-            curs.execute(statement, params)
-            if is_query:
-                if one_row:
-                    data = curs.fetchone()
-                elif one_col:
-                    data = [result[0] for result in curs.fetchall()]
-                else:
-                    data = curs.fetchall()
-                return data
+                yield con
+
+    async def iterate(self, statement, *params, batch_size=ITERATE_BATCH):
+        """Streams the rows of a query from a server-side cursor, batch_size rows at a time
+
+        Usage::
+
+            async for row in bot.db.iterate("SELECT ...", param):
+                ...
+
+        The connection and its transaction are held until the loop ends, so keep the
+        loop body short. A loop which breaks out early should close the iterator, for
+        instance with contextlib.aclosing, so they are released straight away rather
+        than when the iterator is garbage collected.
+        """
+        async with self.acquire() as con:
+            async with con.transaction():
+                async for row in con.cursor(statement, *params, prefetch=batch_size):
+                    yield row
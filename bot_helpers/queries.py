@@ -0,0 +1,176 @@
+"""Statements run on the bot's hot paths, declared once and prepared on every pool connection
+
+Run them with the typed helpers on Postgres::
+
+    username = await bot.db.fetchval(queries.LASTFM_USERNAME, str(user.id))
+    items = await bot.db.fetch(queries.CATALOGUE_PAGE, user_id, True, 10)
+
+Any statement not declared here still goes through Postgres.execute.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+import asyncpg
+
+QUERIES = []
+
+
+class Row(asyncpg.Record):
+    """Record whose columns can also be read as attributes
+
+    Subclasses only annotate the columns a query returns, they add no storage.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class CatalogueItem(Row):
+    type: str
+    music_id: str
+    artists: List[str]
+    name: str
+    added_by: str
+    added_at: datetime
+
+
+class NumberedQuote(Row):
+    position: int
+    quote: str
+
+
+class Query:
+    """A statement registered for preparation on every connection
+
+    :param statement: SQL text of the statement
+    :param record_class: Row subclass returned for each row
+    :param read_only: Run without wrapping the statement in a transaction
+    :param timeout: Seconds before the statement is cancelled, the pool's
+        DB_COMMAND_TIMEOUT if None
+
+    name is set to the constant the query is declared as, and labels it in metrics.
+    """
+
+    __slots__ = ("statement", "record_class", "read_only", "timeout", "name")
+
+    def __init__(
+        self,
+        statement: str,
+        record_class=Row,
+        read_only: bool = True,
+        timeout: Optional[float] = None,
+    ):
+        self.statement = statement
+        self.record_class = record_class
+        self.read_only = read_only
+        self.timeout = timeout
+        self.name = None
+        QUERIES.append(self)
+
+
+GUILD_PREFIX = Query(
+    """
+    SELECT prefix FROM guilds WHERE guild_id=$1
+    """
+)
+
+CATALOGUE_ENABLED = Query(
+    """
+    SELECT catalogue_enabled FROM users WHERE user_id=$1
+    """
+)
+
+QUOTE_SHUFFLE_CHANNEL = Query(
+    """
+    SELECT true FROM quote_shuffle_channels WHERE channel_id=$1
+    """
+)
+
+LASTFM_USERNAME = Query(
+    """
+    SELECT last_fm FROM users WHERE user_id=$1
+    """
+)
+
+CATALOGUE_ID_BY_INDEX = Query(
+    """
+    SELECT music_id
+    FROM catalogue
+    WHERE approved = $1
+    AND user_id = $2
+    ORDER BY added_at, music_id
+    LIMIT 1 OFFSET $3
+    """
+)
+
+CATALOGUE_PAGE = Query(
+    """
+    SELECT type, music_id, artists, name, added_by, added_at
+    FROM catalogue
+    WHERE user_id = $1
+    AND approved = $2
+    ORDER BY added_at, music_id
+    LIMIT $3
+    """,
+    CatalogueItem,
+)
+
+CATALOGUE_PAGE_AFTER = Query(
+    """
+    SELECT type, music_id, artists, name, added_by, added_at
+    FROM catalogue
+    WHERE user_id = $1
+    AND approved = $2
+    AND (added_at, music_id) > ($3, $4)
+    ORDER BY added_at, music_id
+    LIMIT $5
+    """,
+    CatalogueItem,
+)
+
+CATALOGUE_PAGE_AT = Query(
+    """
+    SELECT type, music_id, artists, name, added_by, added_at
+    FROM catalogue
+    WHERE user_id = $1
+    AND approved = $2
+    ORDER BY added_at, music_id
+    LIMIT $3 OFFSET $4
+    """,
+    CatalogueItem,
+)
+
+QUOTE_BY_POSITION = Query(
+    """
+    SELECT quote FROM quote_entries WHERE position=$1 AND guild_id=$2 AND user_id=$3
+    """
+)
+
+QUOTE_PAGE_AFTER = Query(
+    """
+    SELECT position, quote FROM quote_entries
+    WHERE guild_id=$1 AND user_id=$2 AND position > $3
+    ORDER BY position
+    LIMIT $4
+    """,
+    NumberedQuote,
+)
+
+QUOTE_PAGE_AT = Query(
+    """
+    SELECT position, quote FROM quote_entries
+    WHERE guild_id=$1 AND user_id=$2
+    ORDER BY position
+    LIMIT $3 OFFSET $4
+    """,
+    NumberedQuote,
+)
+
+for _name, _query in list(globals().items()):
+    if isinstance(_query, Query):
+        _query.name = _name
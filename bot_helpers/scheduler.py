@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import itertools
+import random
+from time import monotonic
+
+# Priority lanes, lower values are dispatched first
+INTERACTIVE = 0
+BULK = 1
+
+
+class RateLimited(Exception):
+    """Raised by a scheduled request when the remote API asks the caller to slow down
+
+    :param retry_after: Seconds the API asked to wait, if it said
+    """
+
+    def __init__(self, retry_after=None):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class RequestScheduler:
+    """Dispatches requests under a token-bucket rate limit and a concurrency cap
+
+    Waiting requests are served in priority order, so interactive commands jump ahead
+    of bulk traffic already in the queue. Requests raising RateLimited are retried with
+    exponential backoff, holding back every queued request for the same period.
+
+    :param rate: Number of requests allowed per period, also the burst size
+    :param per: Length of the period in seconds
+    :param concurrency: Maximum number of requests in flight
+    :param retries: Number of times a rate limited request is retried
+    :param backoff: Base delay in seconds before the first retry
+    """
+
+    def __init__(
+        self,
+        rate: int,
+        per: float = 1.0,
+        concurrency: int = 4,
+        retries: int = 3,
+        backoff: float = 1.0,
+    ):
+        self.rate = rate
+        self.per = per
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+
+        self.tokens = float(rate)
+        self.updated = monotonic()
+        self.active = 0
+        self.waiters = []
+        self.counter = itertools.count()
+        self.timer = None
+
+    def refill(self):
+        now = monotonic()
+        self.tokens = min(
+            self.rate, self.tokens + (now - self.updated) * self.rate / self.per
+        )
+        self.updated = now
+
+    def pause(self, delay: float):
+        """Holds back every request for at least delay seconds"""
+        self.refill()
+        self.tokens = min(self.tokens, 1 - delay * self.rate / self.per)
+
+    def dispatch(self):
+        """Wakes as many of the highest priority waiters as the tokens and concurrency cap allow"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        self.refill()
+        while self.waiters and self.active < self.concurrency:
+            if self.tokens < 1:
+                delay = (1 - self.tokens) * self.per / self.rate
+                self.timer = asyncio.get_event_loop().call_later(delay, self.dispatch)
+                return
+
+            _, _, waiter = heapq.heappop(self.waiters)
+            if waiter.done():
+                continue
+
+            self.tokens -= 1
+            self.active += 1
+            waiter.set_result(None)
+
+    async def acquire(self, priority: int = BULK):
+        self.refill()
+        if not self.waiters and self.active < self.concurrency and self.tokens >= 1:
+            self.tokens -= 1
+            self.active += 1
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), waiter))
+        self.dispatch()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # The slot was granted just as the caller was cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.active -= 1
+        self.dispatch()
+
+    async def run(self, func, *args, priority: int = BULK):
+        """Runs func(*args) once a slot is free, retrying it if it raises RateLimited
+
+        :param func: Coroutine function performing the request
+        :param priority: INTERACTIVE or BULK
+        :return: Result of func
+        """
+        for attempt in range(self.retries + 1):
+            await self.acquire(priority)
+            try:
+                return await func(*args)
+            except RateLimited as e:
+                if attempt == self.retries:
+                    raise
+                delay = e.retry_after or self.backoff * 2**attempt * (
+                    1 + random.random()
+                )
+                self.pause(delay)
+            finally:
+                self.release()
@@ -0,0 +1,47 @@
+"""Compact no-repeat shuffles for quotes random
+
+A shuffle of n items is stored as a random 63-bit seed plus the number of steps
+already taken. The seed keys a small Feistel network over the smallest power of
+four covering n, whose rounds are keyed BLAKE2b hashes, so the order cannot be
+worked out from the items already shown. Steps landing outside 0..n-1 are walked
+through the network again until they land inside, which keeps it a permutation
+of 0..n-1 without storing the order itself.
+"""
+import hashlib
+import random
+from typing import Optional
+
+# Four rounds make the network a pseudorandom permutation
+ROUNDS = 4
+
+_system_random = random.SystemRandom()
+
+
+def new_seed(rng: Optional[random.Random] = None) -> int:
+    """Picks the seed of a new permutation, from the system's entropy source by default"""
+    return (rng or _system_random).getrandbits(63)
+
+
+def _round(key: bytes, number: int, half: int, mask: int) -> int:
+    digest = hashlib.blake2b(
+        bytes([number]) + half.to_bytes(8, "big"), key=key, digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") & mask
+
+
+def permuted(step: int, size: int, seed: int) -> int:
+    """Returns the item shown at a step of the permutation"""
+    half_bits = max(((size - 1).bit_length() + 1) // 2, 1)
+    mask = (1 << half_bits) - 1
+    key = seed.to_bytes(8, "big")
+
+    value = step
+    while True:
+        left, right = value >> half_bits, value & mask
+        for number in range(ROUNDS):
+            left, right = right, left ^ _round(key, number, right, mask)
+        value = (left << half_bits) | right
+        # The network covers fewer than 4n values, so this takes under four passes
+        # on average
+        if value < size:
+            return value
@@ -0,0 +1,204 @@
+import os
+from typing import List, NamedTuple, Optional
+
+from bot_helpers.cache import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+SPOTIFY_CACHE_SIZE = int(os.getenv("SPOTIFY_CACHE_SIZE", 1024))
+SPOTIFY_CACHE_PERSIST = os.getenv("SPOTIFY_CACHE_PERSIST", "").lower() in ("1", "true")
+
+# Maximum number of IDs per call to Spotify's several-tracks and several-albums endpoints
+BATCH_SIZES = {"track": 50, "album": 20}
+
+
+class MusicMetadata(NamedTuple):
+    music_type: str
+    music_id: str
+    name: str
+    artists: List[str]
+    track_count: int
+    tracks: List[str]
+    image: Optional[str]
+
+
+def cover_url(images) -> Optional[str]:
+    """Picks the medium-sized cover from a Spotify image list, largest first"""
+    if not images:
+        return None
+    return images[1].url if len(images) > 1 else images[0].url
+
+
+class SpotifyMetadata:
+    """Read-through cache of Spotify track and album metadata
+
+    Each object is fetched from Spotify once and kept in memory, and in the
+    spotify_metadata table when SPOTIFY_CACHE_PERSIST is set.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.cache = LRUCache(SPOTIFY_CACHE_SIZE, self.load)
+
+    async def get(self, music_type: str, music_id: str) -> Optional[MusicMetadata]:
+        """Returns the metadata of a track or album, or None for any other type"""
+        if music_type not in ("track", "album"):
+            return None
+        return await self.cache.fetch((music_type, music_id))
+
+    async def get_many(
+        self, music_type: str, music_ids: List[str]
+    ) -> List[Optional[MusicMetadata]]:
+        """Returns the metadata of many tracks or albums of one type, in the order given
+
+        Uncached objects are fetched with as few batch requests as Spotify allows.
+        Entries are None for IDs Spotify does not know about.
+        """
+        if music_type not in BATCH_SIZES:
+            return [None] * len(music_ids)
+
+        found = {}
+        for music_id in music_ids:
+            info = self.cache.get((music_type, music_id))
+            if info is not None:
+                found[music_id] = info
+        missing = [
+            music_id for music_id in dict.fromkeys(music_ids) if music_id not in found
+        ]
+
+        if missing and SPOTIFY_CACHE_PERSIST:
+            records = await self.bot.db.execute(
+                """
+                SELECT music_id, name, artists, track_count, tracks, image_url
+                FROM spotify_metadata
+                WHERE type = $1
+                AND music_id = ANY($2::text[])
+                """,
+                music_type,
+                missing,
+                is_query=True,
+            )
+            for music_id, *record in records:
+                found[music_id] = MusicMetadata(music_type, music_id, *record)
+                self.cache.put((music_type, music_id), found[music_id])
+            missing = [music_id for music_id in missing if music_id not in found]
+
+        fetched = []
+        size = BATCH_SIZES[music_type]
+        for start in range(0, len(missing), size):
+            chunk = missing[start : start + size]
+            if music_type == "track":
+                items = [
+                    self.from_track(track) if track is not None else None
+                    for track in await self.bot.spotify.tracks(chunk)
+                ]
+            else:
+                items = [
+                    await self.from_album(album) if album is not None else None
+                    for album in await self.bot.spotify.albums(chunk)
+                ]
+
+            for music_id, info in zip(chunk, items):
+                if info is not None:
+                    found[music_id] = info
+                    self.cache.put((music_type, music_id), info)
+                    fetched.append(info)
+
+        if fetched and SPOTIFY_CACHE_PERSIST:
+            await self.store_many(fetched)
+
+        return [found.get(music_id) for music_id in music_ids]
+
+    async def get_playlist(self, playlist_id: str) -> List[MusicMetadata]:
+        """Returns the metadata of every track on a playlist, skipping episodes and local files"""
+        tracks = []
+        page = await self.bot.spotify.playlist_items(playlist_id)
+
+        async for item in self.bot.spotify.all_items(page):
+            if item.track is None or item.is_local or not item.track.track:
+                continue
+            info = self.from_track(item.track)
+            self.cache.put(("track", info.music_id), info)
+            tracks.append(info)
+
+        if tracks and SPOTIFY_CACHE_PERSIST:
+            await self.store_many(tracks)
+
+        return tracks
+
+    async def load(self, key) -> MusicMetadata:
+        music_type, music_id = key
+
+        if SPOTIFY_CACHE_PERSIST:
+            record = await self.bot.db.execute(
+                """
+                SELECT name, artists, track_count, tracks, image_url
+                FROM spotify_metadata
+                WHERE type = $1
+                AND music_id = $2
+                """,
+                music_type,
+                music_id,
+                is_query=True,
+                one_row=True,
+            )
+            if record != ():
+                return MusicMetadata(music_type, music_id, *record)
+
+        if music_type == "track":
+            metadata = self.from_track(await self.bot.spotify.track(music_id))
+        else:
+            metadata = await self.from_album(await self.bot.spotify.album(music_id))
+
+        if SPOTIFY_CACHE_PERSIST:
+            await self.store(metadata)
+
+        return metadata
+
+    async def store(self, metadata: MusicMetadata):
+        await self.bot.db.execute(
+            """
+            INSERT INTO spotify_metadata (type, music_id, name, artists, track_count, tracks, image_url)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (type, music_id) DO NOTHING
+            """,
+            *metadata,
+        )
+
+    async def store_many(self, metadata: List[MusicMetadata]):
+        await self.bot.db.executemany(
+            """
+            INSERT INTO spotify_metadata (type, music_id, name, artists, track_count, tracks, image_url)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (type, music_id) DO NOTHING
+            """,
+            *metadata,
+        )
+
+    def from_track(self, track) -> MusicMetadata:
+        return MusicMetadata(
+            "track",
+            track.id,
+            track.name,
+            [artist.name for artist in track.artists],
+            1,
+            [track.name],
+            cover_url(track.album.images),
+        )
+
+    async def from_album(self, album) -> MusicMetadata:
+        tracks = [track.name for track in album.tracks.items]
+        if album.tracks.next is not None:
+            tracks = [
+                track.name async for track in self.bot.spotify.all_items(album.tracks)
+            ]
+
+        return MusicMetadata(
+            "album",
+            album.id,
+            album.name,
+            [artist.name for artist in album.artists],
+            album.total_tracks,
+            tracks,
+            cover_url(album.images),
+        )
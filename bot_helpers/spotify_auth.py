@@ -0,0 +1,83 @@
+import asyncio
+import os
+from typing import Optional
+
+import tekore as tk
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True)
+# Seconds before expiry at which the background task refreshes the token
+SPOTIFY_REFRESH_MARGIN = float(os.getenv("SPOTIFY_REFRESH_MARGIN", 300))
+# Seconds between attempts while refreshing keeps failing
+SPOTIFY_REFRESH_RETRY = float(os.getenv("SPOTIFY_REFRESH_RETRY", 30))
+
+# Requests never go out with a token closer to expiry than this many seconds
+EXPIRY_GRACE = 10
+
+
+class SpotifyCredentials:
+    """Keeps a Spotify client credentials token fresh without blocking the event loop
+
+    A background task refreshes the token SPOTIFY_REFRESH_MARGIN seconds before it
+    expires, so requests keep using the current token while it does. Requests only
+    wait when the token is about to expire, for instance because refreshing kept
+    failing, and every request waiting at once shares the same refresh.
+    """
+
+    def __init__(self, client_id: str, client_secret: str):
+        self.credentials = tk.Credentials(client_id, client_secret, asynchronous=True)
+        self.token: Optional[tk.Token] = None
+        self.refreshing = None
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_event_loop().create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def get_token(self) -> tk.Token:
+        if self.token is None or self.token.expires_in <= EXPIRY_GRACE:
+            await self.refresh()
+        return self.token
+
+    async def refresh(self):
+        """Requests a new token, or waits for the refresh already in progress"""
+        if self.refreshing is None:
+            self.refreshing = asyncio.ensure_future(self.request_token())
+        await asyncio.shield(self.refreshing)
+
+    async def request_token(self):
+        try:
+            self.token = await self.credentials.request_client_token()
+        finally:
+            self.refreshing = None
+
+    async def run(self):
+        while True:
+            delay = self.token.expires_in - SPOTIFY_REFRESH_MARGIN if self.token else 0
+            await asyncio.sleep(max(delay, 0))
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Spotify token refresh failed ({e!r})")
+                await asyncio.sleep(SPOTIFY_REFRESH_RETRY)
+
+
+class CredentialsSender(tk.ExtendingSender):
+    """Sends every request with the current token of a SpotifyCredentials
+
+    :param sender: Sender performing the requests, a new AsyncSender if None
+    """
+
+    def __init__(self, credentials: SpotifyCredentials, sender=None):
+        super().__init__(sender or tk.AsyncSender())
+        self.credentials = credentials
+
+    async def send(self, request):
+        token = await self.credentials.get_token()
+        request.headers["Authorization"] = f"Bearer {token.access_token}"
+        return await self.sender.send(request)
@@ -1,9 +1,43 @@
+import asyncio
+import aiohttp
 from discord import Embed
 from discord.ext import commands
 
-def get_prefix(bot, message):
+async def get_prefix(bot, message):
     if message.guild:
-        prefix = bot.cache.prefixes.get(str(message.guild.id), ';')
+        prefix = await bot.cache.get_prefix(message.guild.id) or ';'
         return commands.when_mentioned_or(prefix)(bot, message)
     else:
         return commands.when_mentioned_or(';')(bot, message)
+
+
+def create_session(limit=32, limit_per_host=8, timeout=15) -> aiohttp.ClientSession:
+    """Creates the bot-wide HTTP session, reusing keep-alive connections across requests
+
+    :param limit: Maximum number of open connections
+    :param limit_per_host: Maximum number of open connections to a single host
+    :param timeout: Total timeout in seconds for a single request
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit, limit_per_host=limit_per_host, ttl_dns_cache=300
+    )
+    return aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)
+    )
+
+
+async def retry(func, *args, attempts=3, delay=1.0, exceptions=(OSError,), **kwargs):
+    """Awaits func(*args, **kwargs), retrying with exponential backoff if it raises one of exceptions
+
+    :param attempts: Total number of attempts before the last error is raised
+    :param delay: Seconds to wait before the first retry, doubled for each retry after it
+    """
+    for attempt in range(attempts):
+        try:
+            return await func(*args, **kwargs)
+        except exceptions as e:
+            if attempt == attempts - 1:
+                raise
+            wait = delay * 2**attempt
+            print(f"{func.__name__} failed ({e!r}), retrying in {wait:.0f}s")
+            await asyncio.sleep(wait)
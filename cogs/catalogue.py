@@ -1,12 +1,92 @@
-import asyncio
-import aiohttp
-from bot_helpers import pagination
+from bot_helpers import pagination, queries
 from urllib.parse import urlparse, urlunparse
 from discord.utils import escape_markdown as esc_md
 from discord import Member, Embed
 from discord.ext import commands
 
 
+class CatalogueSource(pagination.PageSource):
+    """Pages through one user's catalogue in (added_at, music_id) order
+
+    Each page is fetched with a keyset query starting after the last item of the
+    page before it. Pages reached without visiting the one before, such as the last
+    page, fall back to an offset over the same ordering.
+    """
+
+    def __init__(self, bot, guild, user_id, approved: bool, per_page=10):
+        super().__init__(per_page)
+        self.bot = bot
+        self.guild = guild
+        self.user_id = str(user_id)
+        self.approved = approved
+        # Sort key of the last item on each page fetched so far, keyed by the next page
+        self.cursors = {}
+
+    async def count(self) -> int:
+        return await self.bot.db.execute(
+            """
+            SELECT count(*)
+            FROM catalogue
+            WHERE user_id = $1
+            AND approved = $2
+            """,
+            self.user_id,
+            self.approved,
+            is_query=True,
+            one_val=True,
+        )
+
+    async def get_lines(self, page: int):
+        if page == 0:
+            music_info = await self.bot.db.fetch(
+                queries.CATALOGUE_PAGE, self.user_id, self.approved, self.per_page
+            )
+        elif page in self.cursors:
+            music_info = await self.bot.db.fetch(
+                queries.CATALOGUE_PAGE_AFTER,
+                self.user_id,
+                self.approved,
+                *self.cursors[page],
+                self.per_page,
+            )
+        else:
+            music_info = await self.bot.db.fetch(
+                queries.CATALOGUE_PAGE_AT,
+                self.user_id,
+                self.approved,
+                self.per_page,
+                page * self.per_page,
+            )
+
+        if music_info == []:
+            return []
+        self.cursors[page + 1] = (music_info[-1].added_at, music_info[-1].music_id)
+
+        members = await self.bot.member_names.display_names(
+            self.guild, (record.added_by for record in music_info)
+        )
+
+        urls = [
+            urlunparse(
+                [
+                    "https",
+                    "open.spotify.com",
+                    f"/{record[0]}/{record[1]}",
+                    None,
+                    None,
+                    None,
+                ]
+            )
+            for record in music_info
+        ]
+        return [
+            f'{i}. [{esc_md(", ".join(record[2]))} - {esc_md(record[3])}]({url}) | **{record[0]}** - Catalogued by: {esc_md(members[record[4]])}'
+            for i, (record, url) in enumerate(
+                zip(music_info, urls), page * self.per_page + 1
+            )
+        ]
+
+
 class Catalogue(commands.Cog, name="catalogue"):
     def __init__(self, bot) -> None:
         self.bot = bot
@@ -20,7 +100,7 @@ class Catalogue(commands.Cog, name="catalogue"):
                 check_id = ctx.message.raw_mentions[0]
             else:
                 check_id = ctx.author.id
-            return ctx.bot.cache.catalogue_users.get(check_id, None)
+            return await ctx.bot.cache.get_catalogue_enabled(check_id)
         return commands.check(predicate)
 
     @commands.group(case_insensitive=True)
@@ -41,6 +121,7 @@ class Catalogue(commands.Cog, name="catalogue"):
             str(ctx.author.id),
             True,
         )
+        self.bot.cache.invalidate_catalogue_enabled(ctx.author.id)
 
         await ctx.send("Catalogue successfully enabled.")
 
@@ -51,13 +132,14 @@ class Catalogue(commands.Cog, name="catalogue"):
         await self.bot.db.execute(
             """
             INSERT INTO users (user_id, catalogue_enabled)
-                VALUES ($1 $2)
+                VALUES ($1, $2)
             ON CONFLICT (user_id) DO UPDATE
-                SET catalogue_enabled = is_catalogue_enabled
+                SET catalogue_enabled = excluded.catalogue_enabled
             """,
             str(ctx.author.id),
             False,
         )
+        self.bot.cache.invalidate_catalogue_enabled(ctx.author.id)
 
         await ctx.send("Catalogue successfully disabled.")
 
@@ -76,41 +158,6 @@ class Catalogue(commands.Cog, name="catalogue"):
 
         target = member if member is not None else ctx.author
 
-        music_info = await self.bot.db.execute(
-            """
-            SELECT type, music_id, artists, name, added_by 
-            FROM catalogue
-            WHERE user_id = $1
-            AND approved = $2
-            """,
-            str(target.id),
-            approval_status,
-            is_query=True,
-        )
-
-        members = {
-            record[4]: await ctx.guild.fetch_member(int(record[4]))
-            for record in music_info
-        }
-
-        urls = [
-            urlunparse(
-                [
-                    "https",
-                    "open.spotify.com",
-                    f"/{record[0]}/{record[1]}",
-                    None,
-                    None,
-                    None,
-                ]
-            )
-            for record in music_info
-        ]
-        catalogue_items = [
-            f'{i}. [{esc_md(", ".join(record[2]))} - {esc_md(record[3])}]({url}) | **{record[0]}** - Catalogued by: {esc_md(members[record[4]].display_name)}'
-            for i, (record, url) in enumerate(zip(music_info, urls), 1)
-        ]
-
         to_send = (
             Embed(
                 title=f"{esc_md(target.display_name)}'s Catalogue",
@@ -123,46 +170,40 @@ class Catalogue(commands.Cog, name="catalogue"):
                 icon_url=ctx.author.avatar_url,
             )
         )
-        if catalogue_items != []:
-            await pagination.send_pages(ctx, to_send, catalogue_items)
-        else:
+        source = CatalogueSource(self.bot, ctx.guild, target.id, approval_status)
+        if not await pagination.send_lazy_pages(ctx, to_send, source):
             await ctx.send("Your catalogue is empty!")
 
-    @catalogue.command(description="Check your catalogue for tracks/albums you have completed.")
+    @catalogue.command(
+        description="See the tracks/albums in your catalogue you have completed since the last check. Use check full to recount all of your plays."
+    )
     @commands.check(is_target_self)
     @is_enabled()
-    async def check(self, ctx):
-        tasks = []
+    async def check(self, ctx, mode: str = None):
+
+        if mode == "full":
+            self.bot.completion.request(ctx.author.id, full=True)
+            await ctx.send(
+                "Your whole catalogue will be rechecked shortly, use check again in a few minutes to see the results."
+            )
+            return
 
-        music_info = await self.bot.db.execute(
+        completed_items = await self.bot.db.execute(
             """
-            SELECT type, music_id, artists, name, added_by
-            FROM catalogue
+            DELETE FROM catalogue_completions
             WHERE user_id = $1
-            AND approved = $2
+            RETURNING type, music_id, artists, name, added_by, plays, completed_at
             """,
             str(ctx.author.id),
-            True,
             is_query=True,
         )
+        completed_items = sorted(completed_items, key=lambda item: item[6])
 
-        members = {
-            record[4]: await ctx.guild.fetch_member(int(record[4]))
-            for record in music_info
-        }
-
-        for record in music_info:
-            tasks.append(self.get_music_plays(ctx, *tuple(record)[:4]))
-
-        playcounts = await asyncio.gather(*tasks)
-
-        completed_items = [
-            [*tuple(rec), count]
-            for rec, count in zip(music_info, playcounts)
-            if count != 0
-        ]
+        members = await self.bot.member_names.display_names(
+            ctx.guild, (item[4] for item in completed_items)
+        )
 
-        if completed_items != ():
+        if completed_items != []:
 
             urls = [
                 urlunparse(
@@ -179,23 +220,10 @@ class Catalogue(commands.Cog, name="catalogue"):
             ]
 
             embed_items = [
-                f'{i}. [{esc_md(", ".join(item[2]))} - {esc_md(item[3])}]({url}) - {item[5]} {"plays" if item[5] > 1 else "play"} | **{item[0]}** - Catalogued by: {esc_md(members[item[4]].display_name)}'
+                f'{i}. [{esc_md(", ".join(item[2]))} - {esc_md(item[3])}]({url}) - {item[5]} {"plays" if item[5] > 1 else "play"} | **{item[0]}** - Catalogued by: {esc_md(members[item[4]])}'
                 for i, (item, url) in enumerate(zip(completed_items, urls), 1)
             ]
 
-            [
-                await self.bot.db.execute(
-                    """
-                    DELETE FROM catalogue
-                    WHERE user_id = $1
-                    AND music_id = $2
-                    """,
-                    str(ctx.author.id),
-                    item[1],
-                )
-                for item in completed_items
-            ]
-
             to_send = Embed(
                 title=f"{esc_md(ctx.author.display_name)}'s Completed items",
                 description="",
@@ -205,9 +233,47 @@ class Catalogue(commands.Cog, name="catalogue"):
             await pagination.send_pages(ctx, to_send, embed_items)
 
         else:
-            await ctx.send(
-                "You have not completed any of the items in your catalogue since the last check."
+            checked_at = await self.bot.db.execute(
+                """
+                SELECT completion_checked_at FROM users WHERE user_id = $1
+                """,
+                str(ctx.author.id),
+                is_query=True,
+                one_val=True,
             )
+            # Items finished since the last background check show up after this one
+            self.bot.completion.request(ctx.author.id)
+            if checked_at in (None, ()):
+                await ctx.send(
+                    "Your catalogue is being checked for the first time, use check again in a few minutes to see the results."
+                )
+            else:
+                await ctx.send(
+                    "You have not completed any of the items in your catalogue since the last check. It is being checked again, use check again in a few minutes to see any new results."
+                )
+
+    @catalogue.command(
+        description="Get a DM when items in your catalogue are completed. Use notify off to stop."
+    )
+    @commands.check(is_target_self)
+    @is_enabled()
+    async def notify(self, ctx, setting: str = "on"):
+
+        enabled = setting.lower() != "off"
+
+        await self.bot.db.execute(
+            """
+            UPDATE users
+            SET catalogue_notify = $2
+            WHERE user_id = $1
+            """,
+            str(ctx.author.id),
+            enabled,
+        )
+
+        await ctx.send(
+            f"Completion notifications successfully {'enabled' if enabled else 'disabled'}."
+        )
 
     @catalogue.command(description="Recommend a song to another user.")
     @is_enabled()
@@ -215,13 +281,14 @@ class Catalogue(commands.Cog, name="catalogue"):
 
         music_type, music_id = urlparse(link).path[1:].split("/", 2)
 
-        name, artists, count = await self.get_music_info(music_type, music_id)
-        image = await self.get_music_art(music_type, music_id)
+        name, artists, count, image, tracks = await self.get_music_info(
+            music_type, music_id
+        )
 
         await self.bot.db.execute(
             """
-            INSERT INTO catalogue (user_id, type, music_id, approved, artists, name, added_by, track_count)
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            INSERT INTO catalogue (user_id, type, music_id, approved, artists, name, added_by, track_count, image_url, tracks)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
             ON CONFLICT (user_id, music_id) DO NOTHING
             """,
             str(member.id),
@@ -232,6 +299,8 @@ class Catalogue(commands.Cog, name="catalogue"):
             name,
             str(ctx.author.id),
             count,
+            image,
+            tracks,
         )
 
         to_send = (
@@ -252,13 +321,14 @@ class Catalogue(commands.Cog, name="catalogue"):
     async def save(self, ctx, link: str):
 
         music_type, music_id = urlparse(link).path[1:].split("/", 1)
-        name, artists, count = await self.get_music_info(music_type, music_id)
-        image = await self.get_music_art(music_type, music_id)
+        name, artists, count, image, tracks = await self.get_music_info(
+            music_type, music_id
+        )
 
         await self.bot.db.execute(
             """
-            INSERT INTO catalogue (user_id, type, music_id, approved, artists, name, added_by, track_count)
-                VALUES ($1, $2, $3, $4, $5, $6, $1, $7)
+            INSERT INTO catalogue (user_id, type, music_id, approved, artists, name, added_by, track_count, image_url, tracks)
+                VALUES ($1, $2, $3, $4, $5, $6, $1, $7, $8, $9)
             ON CONFLICT (user_id, music_id) DO NOTHING
             """,
             str(ctx.author.id),
@@ -268,6 +338,8 @@ class Catalogue(commands.Cog, name="catalogue"):
             artists,
             name,
             count,
+            image,
+            tracks,
         )
 
         to_send = (
@@ -282,6 +354,97 @@ class Catalogue(commands.Cog, name="catalogue"):
 
         await ctx.send(embed=to_send)
 
+    @catalogue.command(
+        name="import",
+        description="Save several songs/albums, or every song on a playlist, to your own catalogue.",
+    )
+    @commands.check(is_target_self)
+    @is_enabled()
+    async def import_links(self, ctx, *links: str):
+
+        music_ids = {"track": [], "album": []}
+        items = []
+        skipped = 0
+
+        for link in links:
+            try:
+                music_type, music_id = urlparse(link).path[1:].split("/", 1)
+            except ValueError:
+                skipped += 1
+                continue
+
+            if music_type == "playlist":
+                items.extend(await self.bot.metadata.get_playlist(music_id))
+            elif music_type in music_ids:
+                music_ids[music_type].append(music_id)
+            else:
+                skipped += 1
+
+        for music_type, ids in music_ids.items():
+            if ids != []:
+                found = await self.bot.metadata.get_many(music_type, ids)
+                skipped += found.count(None)
+                items.extend(info for info in found if info is not None)
+
+        if items == []:
+            await ctx.send("None of those links could be imported.")
+            return
+
+        # Playlists can hold the same track more than once
+        items = list({info.music_id: info for info in items}.values())
+
+        async with self.bot.db.transaction("import links") as con:
+            existing = {
+                record["music_id"]
+                for record in await con.fetch(
+                    """
+                    SELECT music_id FROM catalogue
+                    WHERE user_id = $1
+                    AND music_id = ANY($2::text[])
+                    """,
+                    str(ctx.author.id),
+                    [info.music_id for info in items],
+                )
+            }
+            items = [info for info in items if info.music_id not in existing]
+
+            await con.executemany(
+                """
+                INSERT INTO catalogue (user_id, type, music_id, approved, artists, name, added_by, track_count, image_url, tracks)
+                    VALUES ($1, $2, $3, $4, $5, $6, $1, $7, $8, $9)
+                ON CONFLICT (user_id, music_id) DO NOTHING
+                """,
+                [
+                    (
+                        str(ctx.author.id),
+                        info.music_type,
+                        info.music_id,
+                        True,
+                        info.artists,
+                        info.name,
+                        info.track_count,
+                        info.image,
+                        info.tracks,
+                    )
+                    for info in items
+                ],
+            )
+
+        tracks = sum(info.music_type == "track" for info in items)
+        description = f"**{tracks}** tracks and **{len(items) - tracks}** albums saved to your catalogue."
+        if existing:
+            description += f"\n{len(existing)} items were already in your catalogue."
+        if skipped:
+            description += f"\n{skipped} links could not be imported."
+
+        to_send = Embed(
+            title=f"Imported {len(items)} items!",
+            description=description,
+            colour=ctx.author.colour,
+        ).set_author(name=ctx.author.display_name, url=ctx.author.avatar_url)
+
+        await ctx.send(embed=to_send)
+
     @catalogue.command(description="Approve a song that has been recommended to you.")
     @commands.check(is_target_self)
     async def approve(self, ctx, index: int):
@@ -294,7 +457,7 @@ class Catalogue(commands.Cog, name="catalogue"):
             SET approved = $1
             WHERE user_id = $2
             AND music_id = $3
-            RETURNING type, music_id, artists, name, added_by
+            RETURNING type, music_id, artists, name, added_by, image_url
             """,
             True,
             str(ctx.author.id),
@@ -306,10 +469,9 @@ class Catalogue(commands.Cog, name="catalogue"):
         url = urlunparse(
             ["https", "open.spotify.com", f"{entry[0]}/{entry[1]}", None, None, None]
         )
-        image = await self.get_music_art(entry[0], entry[1])
+        image = entry[5] or await self.get_music_art(entry[0], entry[1])
 
-        member = await ctx.guild.fetch_member(entry[4])
-        added_by = member.display_name
+        added_by = await self.bot.member_names.display_name(ctx.guild, entry[4])
 
         to_send = (
             Embed(
@@ -336,7 +498,7 @@ class Catalogue(commands.Cog, name="catalogue"):
             DELETE FROM catalogue
             WHERE user_id = $1
             AND music_id = $2
-            RETURNING type, music_id, artists, name, added_by
+            RETURNING type, music_id, artists, name, added_by, image_url
             """,
             str(ctx.author.id),
             entry_id,
@@ -354,10 +516,10 @@ class Catalogue(commands.Cog, name="catalogue"):
                 None,
             ]
         )
-        image = await self.get_music_art(removed[0], removed[1])
+        image = removed[5] or await self.get_music_art(removed[0], removed[1])
 
         added_by = (
-            await ctx.guild.fetch_member(removed[4])
+            await self.bot.member_names.display_name(ctx.guild, removed[4])
             if int(removed[4]) != ctx.author.id
             else "You"
         )
@@ -375,73 +537,16 @@ class Catalogue(commands.Cog, name="catalogue"):
         await ctx.send(embed=to_send)
 
     async def get_music_info(self, music_type: str, id: str):
-        if music_type == "track":
-            track = await self.bot.spotify.track(id)
-            artists = [artist.name for artist in track.artists]
-            return track.name, artists, 1
-
-        elif music_type == "album":
-            album = await self.bot.spotify.album(id)
-            artists = [artist.name for artist in album.artists]
-            return album.name, artists, album.total_tracks
-
-        else:
-            pass
+        info = await self.bot.metadata.get(music_type, id)
+        return info.name, info.artists, info.track_count, info.image, info.tracks
 
     async def get_music_art(self, music_type: str, id: str):
-        if music_type == "track":
-            track = await self.bot.spotify.track(id)
-            return track.album.images[1].url
-        elif music_type == "album":
-            album = await self.bot.spotify.album(id)
-            return album.images[1].url
-
-    async def get_music_plays(self, ctx, music_type, music_id, artists, name):
-        lastfm = self.bot.get_cog("lastfm")
-        await lastfm.get_username(ctx)
-
-        if music_type == "track":
-            count = await lastfm.get_playcount(
-                artists[0], name, music_type, ctx.lastfm_user
-            )
-            return int(count)
-
-        elif music_type == "album":
-
-            tracks = []
-            tasks = []
-
-            album = await self.bot.spotify.album_tracks(music_id)
-            track_pages = self.bot.spotify.all_pages(album)
-
-            async for page in track_pages:
-                tracks.extend(page.items)
-
-            for track in tracks:
-                tasks.append(
-                    lastfm.get_playcount(
-                        artists[0], track.name, "track", ctx.lastfm_user
-                    )
-                )
-
-            counts = await asyncio.gather(*tasks)
-            counts = [int(count) for count in counts]
-            return sum(counts) if 0 not in counts else 0
+        info = await self.bot.metadata.get(music_type, id)
+        return info.image
 
     async def get_music_by_index(self, ctx, index: int, approved: bool):
-        return await self.bot.db.execute(
-            """
-            SELECT music_id
-            FROM catalogue
-            WHERE approved = $1
-            AND user_id = $2
-            LIMIT 1 OFFSET $3
-            """,
-            approved,
-            str(ctx.author.id),
-            index - 1,
-            is_query=True,
-            one_val=True,
+        return await self.bot.db.fetchval(
+            queries.CATALOGUE_ID_BY_INDEX, approved, str(ctx.author.id), index - 1
         )
 
 
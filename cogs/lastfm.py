@@ -1,5 +1,7 @@
 import os
-import aiohttp
+from bot_helpers import queries
+from bot_helpers.cache import LRUCache
+from bot_helpers.scheduler import INTERACTIVE, RateLimited, RequestScheduler
 from discord import Embed
 
 from discord.ext import commands
@@ -9,11 +11,35 @@ from dotenv import load_dotenv
 load_dotenv(verbose=True)
 
 LASTFM_KEY = os.getenv("LAST_KEY")
+LASTFM_RATE = int(os.getenv("LASTFM_RATE", 5))
+LASTFM_CONCURRENCY = int(os.getenv("LASTFM_CONCURRENCY", 4))
+LASTFM_CACHE_SIZE = int(os.getenv("LASTFM_CACHE_SIZE", 4096))
+LASTFM_CACHE_TTL = float(os.getenv("LASTFM_CACHE_TTL", 600))
+LASTFM_CACHE_PERSIST = os.getenv("LASTFM_CACHE_PERSIST", "").lower() in ("1", "true")
+
+# Error 6 (invalid parameters) is how Last.fm reports an unknown user, artist, album
+# or track, asking again gives the same answer
+NOT_FOUND_ERRORS = (6,)
+
+
+class NotFound(Exception):
+    """Raised by a Last.fm request when the user or item it asked about does not exist
+
+    Other failures, such as network errors, server errors and errors 8, 11 and 16,
+    may pass on a retry and make the request return None instead.
+    """
 
 
 class LastFM(commands.Cog, name="lastfm"):
     def __init__(self, bot) -> None:
         self.bot = bot
+        self.scheduler = RequestScheduler(LASTFM_RATE, concurrency=LASTFM_CONCURRENCY)
+        self.requests = 0
+        self.playcounts = LRUCache(
+            LASTFM_CACHE_SIZE, self.load_playcount, ttl=LASTFM_CACHE_TTL
+        )
+        # Tracklists barely change, so they are kept until evicted
+        self.album_tracks = LRUCache(LASTFM_CACHE_SIZE, self.load_album_tracks)
 
     def is_target_self(ctx):
         return not bool(ctx.message.mentions)
@@ -90,7 +116,37 @@ class LastFM(commands.Cog, name="lastfm"):
     # @fm.command()
     # async def
 
-    async def get_playcount(self, artist, name, music_type, username=None):
+    async def get_playcount(
+        self, artist, name, music_type, username=None, priority=INTERACTIVE
+    ):
+        return await self.playcounts.fetch(
+            (music_type, artist, name, username), priority
+        )
+
+    async def load_playcount(self, key, priority=INTERACTIVE):
+        music_type, artist, name, username = key
+
+        if LASTFM_CACHE_PERSIST:
+            count = await self.bot.db.execute(
+                """
+                SELECT playcount FROM lastfm_playcounts
+                WHERE method = $1
+                AND artist = $2
+                AND name = $3
+                AND username = $4
+                AND fetched_at > now() - make_interval(secs => $5)
+                """,
+                music_type,
+                artist,
+                name or "",
+                username or "",
+                LASTFM_CACHE_TTL,
+                is_query=True,
+                one_val=True,
+            )
+            if count != ():
+                return count
+
         params = {"method": f"{music_type}.getInfo", "artist": artist}
 
         if name is not None:
@@ -98,30 +154,97 @@ class LastFM(commands.Cog, name="lastfm"):
         if username is not None:
             params["username"] = username
 
-        info = await self.request_lastfm(params)
+        try:
+            info = await self.request_lastfm(params, priority)
+        except NotFound:
+            # Nobody has played an item Last.fm does not know, and caching that keeps
+            # later checks from asking again
+            count = 0
+        else:
+            if info is None:
+                return None
+
+            # userplaycount is left out for items the user has never played
+            count = int(
+                info[f"{music_type}"].get("userplaycount", 0)
+                if username is not None
+                else info[f"{music_type}"]["playcount"]
+            )
 
-        return (
-            info[f"{music_type}"]["userplaycount"]
-            if username is not None
-            else info[f"{music_type}"]["playcount"]
-        )
+        if LASTFM_CACHE_PERSIST:
+            await self.bot.db.execute(
+                """
+                INSERT INTO lastfm_playcounts (method, artist, name, username, playcount)
+                    VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (method, artist, name, username) DO UPDATE
+                    SET playcount = excluded.playcount, fetched_at = now()
+                """,
+                music_type,
+                artist,
+                name or "",
+                username or "",
+                count,
+            )
+
+        return count
 
-    async def request_lastfm(self, params):
+    async def get_album_tracks(self, artist, name, priority=INTERACTIVE):
+        """Returns an album's track names as Last.fm records them
+
+        :return: Track names, an empty list if Last.fm does not know the album, or None
+            if it could not be reached
+        """
+        return await self.album_tracks.fetch((artist, name), priority)
+
+    async def load_album_tracks(self, key, priority=INTERACTIVE):
+        artist, name = key
+
+        try:
+            info = await self.request_lastfm(
+                {"method": "album.getInfo", "artist": artist, "album": name}, priority
+            )
+        except NotFound:
+            return []
+
+        if info is None:
+            return None
+
+        tracks = info["album"].get("tracks", {}).get("track", [])
+        # An album holding a single track is returned as an object rather than a list
+        if isinstance(tracks, dict):
+            tracks = [tracks]
+        return [track["name"] for track in tracks]
+
+    async def request_lastfm(self, params, priority=INTERACTIVE):
         params |= {"api_key": LASTFM_KEY, "format": "json"}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "http://ws.audioscrobbler.com/2.0/", params=params
-            ) as resp:
-
-                info = await resp.json()
-
-                if info is not None:
-                    if resp.status == 200 and "error" not in info.keys():
-                        return info
-                    elif "error" in info.keys():
-                        pass
-                else:
+        return await self.scheduler.run(self.send_request, params, priority=priority)
+
+    async def send_request(self, params):
+        self.requests += 1
+        async with self.bot.session.get(
+            "http://ws.audioscrobbler.com/2.0/", params=params
+        ) as resp:
+
+            if resp.status == 429:
+                retry_after = resp.headers.get("Retry-After")
+                raise RateLimited(float(retry_after) if retry_after else None)
+
+            info = await resp.json()
+
+            if info is not None:
+                # Error 29: rate limit exceeded
+                if info.get("error") == 29:
+                    raise RateLimited()
+
+                if info.get("error") in NOT_FOUND_ERRORS:
+                    raise NotFound(info.get("message"))
+
+                if resp.status == 200 and "error" not in info.keys():
+                    return info
+                elif "error" in info.keys():
                     pass
+            else:
+                pass
 
     async def get_username(self, ctx):
         if bool(ctx.message.mentions):
@@ -129,11 +252,8 @@ class LastFM(commands.Cog, name="lastfm"):
         else:
             ctx.target = ctx.author
 
-        ctx.lastfm_user = await ctx.bot.db.execute(
-            """SELECT last_fm FROM users WHERE user_id=$1""",
-            str(ctx.target.id),
-            is_query=True,
-            one_val=True,
+        ctx.lastfm_user = await ctx.bot.db.fetchval(
+            queries.LASTFM_USERNAME, str(ctx.target.id)
         )
 
 
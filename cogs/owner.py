@@ -1,4 +1,5 @@
 from discord.ext import commands
+from bot_helpers.postgres import shorten
 class Owner(commands.Cog, name="owner"):
     def __init__(self, bot) -> None:
         self.bot = bot
@@ -17,5 +18,27 @@ class Owner(commands.Cog, name="owner"):
         await ctx.send("Logging out.")
         await self.bot.close()
 
+    @owner.command(description="Show database pool usage and the slowest statements.")
+    async def dbstats(self, ctx, top: int = 8):
+        pool = self.bot.db.pool_stats()
+        metrics = self.bot.db.metrics
+        acquire = metrics.acquire
+
+        lines = [
+            f"Pool: {pool['in_use']} in use, {pool['idle']} idle ({pool['min']}-{pool['max']})",
+            f"Acquire wait: mean {acquire.mean:.2f}ms, p95 {acquire.quantile(0.95):.1f}ms, max {acquire.max:.1f}ms over {acquire.count}",
+            f"Slow statements: {metrics.slow}",
+            "",
+        ]
+        statements = sorted(
+            metrics.statements.items(), key=lambda item: item[1].total, reverse=True
+        )
+        for label, histogram in statements[:top]:
+            lines.append(
+                f"{histogram.count}x mean {histogram.mean:.1f}ms p95 {histogram.quantile(0.95):.1f}ms max {histogram.max:.1f}ms\n  {shorten(label)}"
+            )
+
+        await ctx.send("```\n" + "\n".join(lines)[:1990] + "\n```")
+
 def setup(bot):
     bot.add_cog(Owner(bot))
\ No newline at end of file
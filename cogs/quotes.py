@@ -1,11 +1,120 @@
-import random
 import asyncio
-from bot_helpers import pagination  # pylint: disable=import-error
+from bot_helpers import pagination, queries, shuffle  # pylint: disable=import-error
 from discord import Member, Embed
 from discord.ext import commands
 from discord.utils import escape_markdown as esc_md
 
 
+class QuoteSource(pagination.PageSource):
+    """Pages through one user's quotes in position order
+
+    Each page is fetched with a keyset query starting after the last position on
+    the page before it, and pages jumped to directly use an offset instead.
+    """
+
+    def __init__(self, bot, guild_id, user_id, per_page=10):
+        super().__init__(per_page)
+        self.bot = bot
+        self.guild_id = str(guild_id)
+        self.user_id = str(user_id)
+        # Last position on each page fetched so far, keyed by the next page
+        self.cursors = {0: 0}
+
+    async def count(self) -> int:
+        return await self.bot.db.execute(
+            """SELECT count(*) FROM quote_entries WHERE guild_id=$1 AND user_id=$2""",
+            self.guild_id,
+            self.user_id,
+            is_query=True,
+            one_val=True,
+        )
+
+    async def get_lines(self, page: int):
+        if page in self.cursors:
+            quotes = await self.bot.db.fetch(
+                queries.QUOTE_PAGE_AFTER,
+                self.guild_id,
+                self.user_id,
+                self.cursors[page],
+                self.per_page,
+            )
+        else:
+            quotes = await self.bot.db.fetch(
+                queries.QUOTE_PAGE_AT,
+                self.guild_id,
+                self.user_id,
+                self.per_page,
+                page * self.per_page,
+            )
+
+        if quotes != []:
+            self.cursors[page + 1] = quotes[-1].position
+
+        return [
+            f'{position}. "*{quote}*"'
+            if len(quote) < 196
+            else f'{position}. "*{quote[:193]}...*"'
+            for position, quote in quotes
+        ]
+
+
+class SearchSource(pagination.PageSource):
+    """Pages through the quotes in a guild matching a full-text query, best match first
+
+    :param user_id: Only search this user's quotes, or every user's if None
+    """
+
+    def __init__(self, bot, guild, query: str, user_id=None, per_page=10):
+        super().__init__(per_page)
+        self.bot = bot
+        self.guild = guild
+        self.query = query
+        self.user_id = str(user_id) if user_id is not None else None
+
+    async def count(self) -> int:
+        return await self.bot.db.execute(
+            """SELECT count(*) FROM quote_entries
+            WHERE guild_id=$1
+            AND ($2::text IS NULL OR user_id=$2)
+            AND search @@ websearch_to_tsquery('simple', $3)
+            """,
+            str(self.guild.id),
+            self.user_id,
+            self.query,
+            is_query=True,
+            one_val=True,
+        )
+
+    async def get_lines(self, page: int):
+        quotes = await self.bot.db.execute(
+            """SELECT user_id, position, quote
+            FROM quote_entries, websearch_to_tsquery('simple', $3) AS query
+            WHERE guild_id=$1
+            AND ($2::text IS NULL OR user_id=$2)
+            AND search @@ query
+            ORDER BY ts_rank(search, query) DESC, user_id, position
+            LIMIT $4 OFFSET $5
+            """,
+            str(self.guild.id),
+            self.user_id,
+            self.query,
+            self.per_page,
+            page * self.per_page,
+            is_query=True,
+        )
+
+        members = await self.bot.member_names.display_names(
+            self.guild, (user_id for user_id, _, _ in quotes)
+        )
+
+        return [
+            f'{esc_md(members[user_id])} #{position}. "*{quote}*"'
+            if len(quote) < 196
+            else f'{esc_md(members[user_id])} #{position}. "*{quote[:193]}...*"'
+            for user_id, position, quote in quotes
+        ]
+
+
 class Quotes(commands.Cog, name="quotes"):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
@@ -21,13 +130,12 @@ class Quotes(commands.Cog, name="quotes"):
         target = member if member is not None else ctx.author
 
         await self.bot.db.execute(
-            """INSERT INTO quotes 
-               VALUES ($1, $2, $3)
+            """INSERT INTO quotes (guild_id, user_id)
+               VALUES ($1, $2)
                ON CONFLICT DO NOTHING
             """,
             str(ctx.guild.id),
             str(target.id),
-            [],
         )
 
         to_send = (
@@ -69,10 +177,17 @@ class Quotes(commands.Cog, name="quotes"):
         else:
 
             count = await self.bot.db.execute(
-                """DELETE FROM quotes
-                WHERE guild_id = $1
-                AND user_id = $2
-                RETURNING cardinality(quotes)
+                """WITH removed AS (
+                    DELETE FROM quote_entries
+                    WHERE guild_id = $1
+                    AND user_id = $2
+                    RETURNING 1
+                ), removed_user AS (
+                    DELETE FROM quotes
+                    WHERE guild_id = $1
+                    AND user_id = $2
+                )
+                SELECT count(*) FROM removed
                 """,
                 str(ctx.guild.id),
                 str(target.id),
@@ -100,19 +215,43 @@ class Quotes(commands.Cog, name="quotes"):
 
         target = member if member is not None else ctx.author
 
-        await self.bot.db.execute(
-            """UPDATE quotes
-           SET quotes = quotes || $1
-           WHERE guild_id = $2
-           AND user_id = $3
-        """,
-            [esc_md(quote)],
-            str(ctx.guild.id),
-            str(target.id),
-        )
+        async with self.bot.db.transaction("add quote") as con:
+            # Locking the user's row serialises adds, so positions cannot collide
+            enabled = await con.fetchval(
+                """SELECT true FROM quotes
+               WHERE guild_id = $1
+               AND user_id = $2
+               FOR UPDATE
+            """,
+                str(ctx.guild.id),
+                str(target.id),
+            )
+            if enabled:
+                position = await con.fetchval(
+                    """INSERT INTO quote_entries (guild_id, user_id, position, quote)
+                   SELECT $1, $2, coalesce(max(position), 0) + 1, $3
+                   FROM quote_entries
+                   WHERE guild_id = $1
+                   AND user_id = $2
+                   RETURNING position
+                """,
+                    str(ctx.guild.id),
+                    str(target.id),
+                    esc_md(quote),
+                )
+
+        if not enabled:
+            await ctx.send(
+                f"{esc_md(target.display_name)} has not been added to quotes yet."
+            )
+            return
 
         to_send = (
-            Embed(title="Added quote", description=esc_md(quote), colour=target.colour)
+            Embed(
+                title=f"Added quote #{position}",
+                description=esc_md(quote),
+                colour=target.colour,
+            )
             .set_author(name=target.display_name, url=target.avatar_url)
             .set_footer(
                 text=f"Added by {ctx.author.display_name}",
@@ -127,19 +266,23 @@ class Quotes(commands.Cog, name="quotes"):
         target = member if member is not None else ctx.author
 
         removed = await self.bot.db.execute(
-            """UPDATE quotes
-           SET quotes = array_remove(quotes, quotes[$1])
-           WHERE guild_id = $2
-           and user_id = $3
-           RETURNING quotes[$1]
+            """DELETE FROM quote_entries
+           WHERE guild_id = $1
+           AND user_id = $2
+           AND position = $3
+           RETURNING quote
         """,
-            index,
             str(ctx.guild.id),
             str(target.id),
+            index,
             is_query=True,
             one_val=True,
         )
 
+        if removed == ():
+            await ctx.send(f"There is no quote #{index} for this user.")
+            return
+
         to_send = (
             Embed(title="Removed quote", description=removed, colour=target.colour)
             .set_author(name=esc_md(target.display_name), url=target.avatar_url)
@@ -155,15 +298,16 @@ class Quotes(commands.Cog, name="quotes"):
     async def random(self, ctx: commands.Context, member: Member = None):
         target = member if member is not None else ctx.author
 
-        quotes = await self.bot.db.execute(
-            """SELECT quotes FROM quotes WHERE guild_id=$1 AND user_id=$2""",
-            str(ctx.guild.id),
-            str(target.id),
-            is_query=True,
-            one_val=True,
-        )
+        if await self.bot.cache.get_quote_shuffle(ctx.channel.id):
+            quote = await self.next_shuffled_quote(
+                ctx.channel.id, ctx.guild.id, target.id
+            )
+        else:
+            quote = await self.random_quote(ctx.guild.id, target.id)
 
-        quote = random.choice(quotes)
+        if quote is None:
+            await ctx.send("This user has no quotes added yet.")
+            return
 
         to_send = (
             Embed(
@@ -180,19 +324,50 @@ class Quotes(commands.Cog, name="quotes"):
 
         await ctx.send(embed=to_send)
 
+    @quotes.command(
+        name="shuffle",
+        description="Make random show every quote once before repeating any in this channel. Use shuffle off to stop.",
+    )
+    @commands.has_permissions(manage_messages=True)
+    async def shuffle_mode(self, ctx: commands.Context, setting: str = "on"):
+
+        enabled = setting.lower() != "off"
+
+        if enabled:
+            await self.bot.db.execute(
+                """INSERT INTO quote_shuffle_channels (channel_id)
+                VALUES ($1)
+                ON CONFLICT DO NOTHING
+                """,
+                str(ctx.channel.id),
+            )
+        else:
+            await self.bot.db.execute(
+                """WITH removed_cursors AS (
+                    DELETE FROM quote_shuffles WHERE channel_id = $1
+                )
+                DELETE FROM quote_shuffle_channels WHERE channel_id = $1
+                """,
+                str(ctx.channel.id),
+            )
+        self.bot.cache.invalidate_quote_shuffle(ctx.channel.id)
+
+        await ctx.send(
+            f"Shuffled quotes successfully {'enabled' if enabled else 'disabled'} in this channel."
+        )
+
     @quotes.command(description="View a specific quote for a user.")
     async def view(self, ctx, index: int, member: Member = None):
         target = member if member is not None else ctx.author
 
-        quote = await self.bot.db.execute(
-            """SELECT quotes[$1] FROM quotes WHERE guild_id=$2 AND user_id=$3""",
-            index,
-            str(ctx.guild.id),
-            str(target.id),
-            is_query=True,
-            one_val=True,
+        quote = await self.bot.db.fetchval(
+            queries.QUOTE_BY_POSITION, index, str(ctx.guild.id), str(target.id)
         )
 
+        if quote is None:
+            await ctx.send(f"There is no quote #{index} for this user.")
+            return
+
         to_send = (
             Embed(
                 title=f"Quote from {esc_md(target.display_name)}",
@@ -212,19 +387,6 @@ class Quotes(commands.Cog, name="quotes"):
     async def userlist(self, ctx, member: Member = None):
         target = member if member is not None else ctx.author
 
-        quotes = await self.bot.db.execute(
-            """SELECT quotes FROM quotes WHERE guild_id=$1 AND user_id=$2""",
-            str(ctx.guild.id),
-            str(target.id),
-            is_query=True,
-            one_val=True,
-        )
-
-        for idx, quote in enumerate(quotes):
-            quotes[idx] = (
-                f'"*{quote}*"' if len(quote) < 196 else f'"*{quote[:193]}...*"'
-            )
-
         to_send = (
             Embed(
                 title=f"Quotes from {esc_md(target.display_name)}",
@@ -237,11 +399,35 @@ class Quotes(commands.Cog, name="quotes"):
                 icon_url=ctx.author.avatar_url,
             )
         )
-        if quotes != []:
-            await pagination.send_pages(ctx, to_send, quotes)
-        else:
+        source = QuoteSource(self.bot, ctx.guild.id, target.id)
+        if not await pagination.send_lazy_pages(ctx, to_send, source):
             await ctx.send("This user has no quotes added yet.")
 
+    @quotes.command(
+        description="Search the quotes in this server, or only a specific user's quotes."
+    )
+    async def search(self, ctx, query: str, member: Member = None):
+
+        to_send = (
+            Embed(
+                title=f'Quotes matching "{esc_md(query)}"',
+                description="",
+                colour=ctx.author.colour,
+            )
+            .set_thumbnail(
+                url=member.avatar_url if member is not None else ctx.guild.icon_url
+            )
+            .set_footer(
+                text=f"Requested by {ctx.author.display_name}",
+                icon_url=ctx.author.avatar_url,
+            )
+        )
+        source = SearchSource(
+            self.bot, ctx.guild, query, member.id if member is not None else None
+        )
+        if not await pagination.send_lazy_pages(ctx, to_send, source):
+            await ctx.send("No quotes match that search.")
+
     @quotes.command(
         description="View a list of users in this server with quotes enabled."
     )
@@ -253,12 +439,9 @@ class Quotes(commands.Cog, name="quotes"):
             one_col=True,
         )
 
-        members = [None] * len(users)
+        members = await self.bot.member_names.display_names(ctx.guild, users)
 
-        for idx, user in enumerate(users):
-            members[idx] = await ctx.guild.fetch_member(user)
-
-        usernames = [esc_md(member.display_name) for member in members]
+        usernames = [esc_md(members[user]) for user in users]
 
         to_send = (
             Embed(
@@ -277,6 +460,86 @@ class Quotes(commands.Cog, name="quotes"):
         else:
             await ctx.send("This server has no users added to the quotes database.")
 
+    async def random_quote(self, guild_id, user_id):
+        # Skips a random number of entries along the (guild_id, user_id, position) index,
+        # which only covers this user's quotes. Picking a rank rather than a position
+        # keeps every quote equally likely when removals have left gaps.
+        quote = await self.bot.db.execute(
+            """SELECT quote FROM quote_entries
+            WHERE guild_id=$1 AND user_id=$2
+            ORDER BY position
+            LIMIT 1
+            OFFSET floor(random() * (
+                SELECT count(*) FROM quote_entries WHERE guild_id=$1 AND user_id=$2
+            ))::bigint
+            """,
+            str(guild_id),
+            str(user_id),
+            is_query=True,
+            one_val=True,
+        )
+        return quote if quote != () else None
+
+    async def next_shuffled_quote(self, channel_id, guild_id, user_id):
+        """Takes the next quote of a user's shuffle in a channel
+
+        A new shuffle starts once every quote has been shown, or when quotes have
+        been added or removed since the shuffle started.
+        """
+        channel_id, guild_id, user_id = str(channel_id), str(guild_id), str(user_id)
+
+        async with self.bot.db.transaction("next shuffled quote") as con:
+            count = await con.fetchval(
+                """SELECT count(*) FROM quote_entries WHERE guild_id=$1 AND user_id=$2""",
+                guild_id,
+                user_id,
+            )
+            if count == 0:
+                return None
+
+            cursor = await con.fetchrow(
+                """SELECT size, seed, step FROM quote_shuffles
+                WHERE channel_id=$1 AND guild_id=$2 AND user_id=$3
+                FOR UPDATE
+                """,
+                channel_id,
+                guild_id,
+                user_id,
+            )
+            if cursor is None or cursor["size"] != count or cursor["step"] >= count:
+                size, seed, step = count, shuffle.new_seed(), 0
+            else:
+                size, seed, step = cursor
+
+            quote = await con.fetchval(
+                """SELECT quote FROM quote_entries
+                WHERE guild_id=$1 AND user_id=$2
+                ORDER BY position
+                LIMIT 1 OFFSET $3
+                """,
+                guild_id,
+                user_id,
+                shuffle.permuted(step, size, seed),
+            )
+
+            await con.execute(
+                """INSERT INTO quote_shuffles (channel_id, guild_id, user_id, size, seed, step)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT (channel_id, guild_id, user_id) DO UPDATE
+                    SET size = excluded.size,
+                    seed = excluded.seed,
+                    step = excluded.step
+                """,
+                channel_id,
+                guild_id,
+                user_id,
+                size,
+                seed,
+                step + 1,
+            )
+
+        return quote
+
 
 def setup(bot):
     bot.add_cog(Quotes(bot))
\ No newline at end of file
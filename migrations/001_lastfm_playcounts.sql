@@ -0,0 +1,10 @@
+-- Persistent backing store for LastFM.playcounts, only used when LASTFM_CACHE_PERSIST is set
+CREATE TABLE IF NOT EXISTS lastfm_playcounts (
+    method TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    name TEXT NOT NULL,
+    username TEXT NOT NULL,
+    playcount INTEGER NOT NULL,
+    fetched_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (method, artist, name, username)
+);
@@ -0,0 +1,12 @@
+-- Persistent backing store for SpotifyMetadata, only used when SPOTIFY_CACHE_PERSIST is set
+CREATE TABLE IF NOT EXISTS spotify_metadata (
+    type TEXT NOT NULL,
+    music_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    artists TEXT[] NOT NULL,
+    track_count INTEGER NOT NULL,
+    tracks TEXT[] NOT NULL,
+    image_url TEXT,
+    fetched_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (type, music_id)
+);
@@ -0,0 +1,5 @@
+-- Cover art and album track names, written at save/recommend time
+-- Existing rows are filled in by tools/backfill_catalogue.py
+ALTER TABLE catalogue
+    ADD COLUMN IF NOT EXISTS image_url TEXT,
+    ADD COLUMN IF NOT EXISTS tracks TEXT[];
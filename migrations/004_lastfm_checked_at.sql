@@ -0,0 +1,3 @@
+-- Timestamp of the newest scrobble processed by catalogue check, for incremental checks
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS lastfm_checked_at BIGINT;
@@ -0,0 +1,17 @@
+-- Results of background completion checks, read and cleared by catalogue check
+CREATE TABLE IF NOT EXISTS catalogue_completions (
+    user_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    music_id TEXT NOT NULL,
+    artists TEXT[] NOT NULL,
+    name TEXT NOT NULL,
+    added_by TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    completed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, music_id)
+);
+
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS completion_checked_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS completion_failures INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS catalogue_notify BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,7 @@
+-- Stable ordering for catalogue listings and index-based approve/remove
+-- Existing rows share the migration time and fall back to music_id order
+ALTER TABLE catalogue
+    ADD COLUMN IF NOT EXISTS added_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS catalogue_user_order
+    ON catalogue (user_id, approved, added_at, music_id);
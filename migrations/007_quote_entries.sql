@@ -0,0 +1,23 @@
+-- One row per quote instead of one array per (guild, user)
+-- quotes keeps one row per user with quotes enabled
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS quote_entries (
+    quote_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    guild_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    quote TEXT NOT NULL,
+    added_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    UNIQUE (guild_id, user_id, position)
+);
+
+-- Array indices become positions, so existing quote numbers are unchanged
+INSERT INTO quote_entries (guild_id, user_id, position, quote)
+    SELECT quotes.guild_id, quotes.user_id, entry.position, entry.quote
+    FROM quotes, unnest(quotes.quotes) WITH ORDINALITY AS entry (quote, position)
+ON CONFLICT (guild_id, user_id, position) DO NOTHING;
+
+ALTER TABLE quotes DROP COLUMN IF EXISTS quotes;
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- Channels where quotes random shows every quote once before repeating
+CREATE TABLE IF NOT EXISTS quote_shuffle_channels (
+    channel_id TEXT PRIMARY KEY
+);
+
+-- Shuffle position of each user's quotes in each shuffle channel
+CREATE TABLE IF NOT EXISTS quote_shuffles (
+    channel_id TEXT NOT NULL,
+    guild_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    seed BIGINT NOT NULL,
+    step INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, guild_id, user_id)
+);
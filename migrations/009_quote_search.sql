@@ -0,0 +1,8 @@
+-- Full-text search over quotes for quotes search
+-- The simple configuration keeps stop words, so short quoted phrases still match
+ALTER TABLE quote_entries
+    ADD COLUMN IF NOT EXISTS search tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', quote)) STORED;
+
+CREATE INDEX IF NOT EXISTS quote_entries_search
+    ON quote_entries USING GIN (search);
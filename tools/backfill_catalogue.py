@@ -0,0 +1,92 @@
+"""One-time backfill of catalogue.image_url and catalogue.tracks for rows saved before they were stored
+
+Run from the repository root with ``python -m tools.backfill_catalogue`` after applying
+migrations/003_catalogue_artwork_tracks.sql. Rows that already have both columns are skipped,
+so the tool can be re-run safely if it is interrupted.
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+
+import tekore as tk
+from dotenv import load_dotenv
+
+from bot_helpers.postgres import Postgres
+from bot_helpers.spotify import SpotifyMetadata
+from bot_helpers.spotify_auth import CredentialsSender, SpotifyCredentials
+
+load_dotenv(verbose=True)
+
+SPOTIFY_TOKEN = os.getenv("SPOT_TOKEN")
+SPOTIFY_SECRET = os.getenv("SPOT_SECRET")
+# Items looked up on Spotify and updated together
+CHUNK_SIZE = 500
+
+
+async def backfill(bot, metadata, music_type, music_ids) -> int:
+    """Fills in the artwork and track names of catalogue rows for one chunk of items
+
+    :return: Number of items Spotify knew about
+    """
+    found = [
+        info
+        for info in await metadata.get_many(music_type, music_ids)
+        if info is not None
+    ]
+
+    await bot.db.executemany(
+        """
+        UPDATE catalogue
+        SET image_url = $3, tracks = $4
+        WHERE type = $1
+        AND music_id = $2
+        """,
+        *[(music_type, info.music_id, info.image, info.tracks) for info in found],
+    )
+    return len(found)
+
+
+async def main():
+    bot = SimpleNamespace()
+    bot.db = Postgres(bot)
+    await bot.db.init_pool()
+    # Refreshed on demand, a long backfill can outlive a single token
+    credentials = SpotifyCredentials(SPOTIFY_TOKEN, SPOTIFY_SECRET)
+    bot.spotify = tk.Spotify(
+        await credentials.get_token(), sender=CredentialsSender(credentials)
+    )
+    metadata = SpotifyMetadata(bot)
+
+    try:
+        for music_type in ("track", "album"):
+            found = total = 0
+            chunk = []
+            # Streamed so memory use stays flat however many rows need backfilling
+            async for (music_id,) in bot.db.iterate(
+                """
+                SELECT DISTINCT music_id
+                FROM catalogue
+                WHERE type = $1
+                AND (image_url IS NULL OR tracks IS NULL)
+                """,
+                music_type,
+            ):
+                chunk.append(music_id)
+                if len(chunk) == CHUNK_SIZE:
+                    found += await backfill(bot, metadata, music_type, chunk)
+                    total += len(chunk)
+                    chunk = []
+
+            if chunk:
+                found += await backfill(bot, metadata, music_type, chunk)
+                total += len(chunk)
+            print(f"Backfilled {found}/{total} {music_type}s")
+
+        print("Backfill complete")
+    finally:
+        await bot.spotify.close()
+        await bot.db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())